@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Headless render benchmark for OverlayPC7Layer.
+
+Renders PC7 layers offscreen into a QImage with
+QgsMapRendererCustomPainterJob and sweeps overlay count, map scale,
+destination CRS and DPI. Results are written as JSON lines, one per case,
+with the per-frame latency and the per-phase timings in milliseconds (the
+render phases come from the layer's render instrumentation).
+
+Run with a QGIS Python environment, e.g.:
+
+    python3 benchmark/benchmark_render.py --counts 1 100 1000 \\
+        --output bench.jsonl
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from kadas_overlay_pc7.overlay_pc7_headless import installKadasStub, initQgis
+
+installKadasStub()
+app = initQgis()
+
+from qgis.PyQt.QtCore import QSize
+from qgis.PyQt.QtGui import QColor, QImage, QPainter
+from qgis.core import QgsCoordinateReferenceSystem, QgsCoordinateTransform, \
+    QgsMapRendererCustomPainterJob, QgsMapSettings, QgsPointXY, QgsProject, \
+    QgsRectangle
+
+from kadas_overlay_pc7.overlay_pc7_layer import OverlayPC7Layer
+from kadas_overlay_pc7 import overlay_pc7_stats
+
+
+# Overlays are scattered around Bern, in LV95
+LAYER_CRS = "EPSG:2056"
+CENTER = QgsPointXY(2600000, 1200000)
+SPREAD = 20000
+
+
+def createLayer(count, lod, symbolCache=False, geometryMode="geodesic",
+                seed=0):
+    rand = random.Random(seed)
+    layer = OverlayPC7Layer("benchmark")
+    layer.setCrs(QgsCoordinateReferenceSystem(LAYER_CRS))
+    layer.setLevelOfDetail(lod)
+    layer.setSymbolCacheEnabled(symbolCache)
+    layer.setGeometryMode(geometryMode)
+    for i in range(count):
+        layer.addOverlay(
+            QgsPointXY(CENTER.x() + rand.uniform(-SPREAD, SPREAD),
+                       CENTER.y() + rand.uniform(-SPREAD, SPREAD)),
+            rand.uniform(0, 360), 45, 135)
+    return layer
+
+
+def mapSettings(layer, crs, scale, dpi, size):
+    """ Returns map settings showing the benchmark area at approximately the
+        given scale. """
+    widthMeters = scale * size.width() / dpi * 0.0254
+    heightMeters = scale * size.height() / dpi * 0.0254
+    extent = QgsRectangle(
+        CENTER.x() - 0.5 * widthMeters, CENTER.y() - 0.5 * heightMeters,
+        CENTER.x() + 0.5 * widthMeters, CENTER.y() + 0.5 * heightMeters)
+    destCrs = QgsCoordinateReferenceSystem(crs)
+    ct = QgsCoordinateTransform(layer.crs(), destCrs, QgsProject.instance())
+
+    settings = QgsMapSettings()
+    settings.setLayers([layer])
+    settings.setDestinationCrs(destCrs)
+    settings.setOutputSize(size)
+    settings.setOutputDpi(dpi)
+    settings.setBackgroundColor(QColor(255, 255, 255))
+    settings.setExtent(ct.transformBoundingBox(extent))
+    return settings
+
+
+def panSettings(settings, rand, step=0.05):
+    """ Recenters settings by a random offset of up to step times the extent
+        size, as the canvas does when panning. """
+    extent = settings.extent()
+    center = extent.center()
+    x = center.x() + rand.uniform(-step, step) * extent.width()
+    y = center.y() + rand.uniform(-step, step) * extent.height()
+    settings.setExtent(QgsRectangle(
+        x - 0.5 * extent.width(), y - 0.5 * extent.height(),
+        x + 0.5 * extent.width(), y + 0.5 * extent.height()))
+
+
+def renderFrame(settings, image):
+    image.fill(0)
+    painter = QPainter(image)
+    job = QgsMapRendererCustomPainterJob(settings, painter)
+    start = time.perf_counter()
+    job.renderSynchronously()
+    elapsed = time.perf_counter() - start
+    painter.end()
+    return 1000. * elapsed
+
+
+def runCase(count, crs, scale, dpi, size, frames, lod, symbolCache,
+            geometryMode, pan=False):
+    phases = {}
+    start = time.perf_counter()
+    layer = createLayer(count, lod, symbolCache, geometryMode)
+    phases["setup"] = 1000. * (time.perf_counter() - start)
+
+    settings = mapSettings(layer, crs, scale, dpi, size)
+    image = QImage(size, QImage.Format_ARGB32_Premultiplied)
+
+    # The first frame fills the geometry caches
+    phases["coldFrame"] = renderFrame(settings, image)
+    layer.renderStats.reset()
+    rand = random.Random(0)
+    times = []
+    for i in range(frames):
+        if pan:
+            panSettings(settings, rand)
+        times.append(renderFrame(settings, image))
+    phases["warmFrame"] = statistics.mean(times)
+    stats = layer.renderStats.summary()
+    phases.update(stats.get("phasesMs", {}))
+
+    return {
+        "count": count,
+        "crs": crs,
+        "scale": scale,
+        "dpi": dpi,
+        "width": size.width(),
+        "height": size.height(),
+        "lod": lod,
+        "symbolCache": symbolCache,
+        "geometryMode": geometryMode,
+        "pan": pan,
+        "frames": frames,
+        "meanMs": statistics.mean(times),
+        "medianMs": statistics.median(times),
+        "minMs": min(times),
+        "maxMs": max(times),
+        "p95Ms": sorted(times)[int(0.95 * (len(times) - 1))],
+        "phasesMs": phases,
+        "vertices": stats.get("vertices"),
+        "cacheHitRate": stats.get("cacheHitRate"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--counts", type=int, nargs="+",
+                        default=[1, 10, 100, 1000])
+    parser.add_argument("--scales", type=float, nargs="+",
+                        default=[10000, 50000, 250000, 1000000])
+    parser.add_argument("--crs", nargs="+",
+                        default=["EPSG:2056", "EPSG:3857", "EPSG:4326"])
+    parser.add_argument("--dpi", type=int, nargs="+", default=[96, 192])
+    parser.add_argument("--size", type=int, nargs=2, default=[1280, 1024],
+                        metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--frames", type=int, default=10,
+                        help="warm frames rendered per case")
+    parser.add_argument("--no-lod", action="store_true",
+                        help="disable the level of detail")
+    parser.add_argument("--symbol-cache", action="store_true",
+                        help="draw from the rasterized symbol cache")
+    parser.add_argument("--pan", action="store_true",
+                        help="pan the map between warm frames")
+    parser.add_argument("--geometry-mode", default="geodesic",
+                        choices=["geodesic", "tangentPlane"])
+    parser.add_argument("--output", help="JSON lines output file "
+                        "(default: stdout)")
+    args = parser.parse_args()
+
+    overlay_pc7_stats.setEnabled(True)
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    size = QSize(*args.size)
+    for count in args.counts:
+        for crs in args.crs:
+            for scale in args.scales:
+                for dpi in args.dpi:
+                    result = runCase(count, crs, scale, dpi, size,
+                                     args.frames, not args.no_lod,
+                                     args.symbol_cache,
+                                     args.geometry_mode, args.pan)
+                    out.write(json.dumps(result) + "\n")
+                    out.flush()
+    if out is not sys.stdout:
+        out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Replays or simulates a live PC7 feed for the overlay live feed mode.
+
+Without --input, --count aircraft circling around Bern are simulated and
+their positions sent --rate times per second each. With --input, the lines
+of a recorded feed (JSON or $PC7 sentences) are sent; JSON lines with a "t"
+member (seconds) are paced accordingly, other lines at --rate per second.
+
+Messages are sent as UDP datagrams, or with --tcp served to the plugin over
+TCP. The defaults match the plugin's default feed settings, e.g.:
+
+    python3 benchmark/replay_feed.py --count 30 --rate 50
+"""
+import argparse
+import json
+import math
+import socket
+import sys
+import time
+from functools import reduce
+
+
+CENTER_LON = 7.44
+CENTER_LAT = 46.95
+# Degrees per meter, approximately at the center latitude
+LAT_PER_METER = 1. / 111132.
+LON_PER_METER = LAT_PER_METER / math.cos(math.radians(CENTER_LAT))
+
+
+def nmeaSentence(name, lon, lat, heading):
+    body = "PC7,%s,%.7f,%.7f,%.1f" % (name, lat, lon, heading)
+    checksum = reduce(lambda value, char: value ^ ord(char), body, 0)
+    return "$%s*%02X" % (body, checksum)
+
+
+def simulate(count, rate, nmea):
+    """ Yields (delay, message) for count aircraft flying circles of 2 to
+        6 km radius at 80 m/s. """
+    start = time.perf_counter()
+    tick = 0
+    while True:
+        t = tick / rate
+        for i in range(count):
+            radius = 2000. + 4000. * i / max(count - 1, 1)
+            angle = 2 * math.pi * i / count + 80. * t / radius
+            lon = CENTER_LON + radius * math.sin(angle) * LON_PER_METER
+            lat = CENTER_LAT + radius * math.cos(angle) * LAT_PER_METER
+            heading = (math.degrees(angle) + 90.) % 360.
+            name = "PC7-%d" % (i + 1)
+            if nmea:
+                yield nmeaSentence(name, lon, lat, heading)
+            else:
+                yield json.dumps({"name": name, "lon": lon, "lat": lat,
+                                  "heading": heading})
+        tick += 1
+        time.sleep(max(0., start + tick / rate - time.perf_counter()))
+
+
+def replay(path, rate, loop):
+    """ Yields the lines of a recorded feed, paced by their "t" member or
+        by rate. """
+    while True:
+        start = time.perf_counter()
+        first = None
+        with open(path) as stream:
+            for number, line in enumerate(stream):
+                line = line.strip()
+                if not line:
+                    continue
+                offset = number / rate
+                try:
+                    t = float(json.loads(line)["t"])
+                    first = t if first is None else first
+                    offset = t - first
+                except (ValueError, KeyError, TypeError):
+                    pass
+                time.sleep(max(0., start + offset - time.perf_counter()))
+                yield line
+        if not loop:
+            return
+
+
+def sendUdp(messages, host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for message in messages:
+        sock.sendto(message.encode("utf-8") + b"\n", (host, port))
+
+
+def serveTcp(messages, host, port):
+    server = socket.create_server((host, port))
+    print("Waiting for a connection on %s:%d" % (host, port),
+          file=sys.stderr)
+    connection = server.accept()[0]
+    for message in messages:
+        connection.sendall(message.encode("utf-8") + b"\n")
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--input", help="recorded feed to replay")
+    parser.add_argument("--loop", action="store_true",
+                        help="replay the recording endlessly")
+    parser.add_argument("--count", type=int, default=10,
+                        help="number of simulated aircraft")
+    parser.add_argument("--rate", type=float, default=50.,
+                        help="messages per second and aircraft")
+    parser.add_argument("--nmea", action="store_true",
+                        help="simulate $PC7 sentences instead of JSON")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=10110)
+    parser.add_argument("--tcp", action="store_true",
+                        help="serve the feed over TCP instead of UDP")
+    args = parser.parse_args()
+
+    if args.input:
+        messages = replay(args.input, args.rate, args.loop)
+    else:
+        messages = simulate(args.count, args.rate, args.nmea)
+    try:
+        if args.tcp:
+            serveTcp(messages, args.host, args.port)
+        else:
+            sendUdp(messages, args.host, args.port)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -21,8 +21,10 @@
  ***************************************************************************/
  This script initializes the plugin, making it known to QGIS.
 """
+import time
 
 
 def classFactory(iface):
+    start = time.perf_counter()
     from .overlay_pc7 import OverlayPC7
-    return OverlayPC7(iface)
+    return OverlayPC7(iface, time.perf_counter() - start)
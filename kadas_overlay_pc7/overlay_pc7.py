@@ -25,23 +25,34 @@ from qgis.PyQt.QtGui import *
 from qgis.PyQt.QtWidgets import *
 from kadas.kadasgui import *
 from . import resources_rc
-from .overlay_pc7_tool import OverlayPC7Tool
-from .overlay_pc7_layer import OverlayPC7LayerType
+from .overlay_pc7_layer_type import OverlayPC7LayerType
+from .overlay_pc7_registry import OverlayPC7LayerRegistry
+from .overlay_pc7_precompute import OverlayPC7Precomputer
+from .overlay_pc7_transforms import transformPool
+from . import overlay_pc7_stats
 import os.path
+import time
 from qgis.core import *
 
 
 class OverlayPC7:
     """QGIS Plugin Implementation."""
 
-    def __init__(self, iface):
+    def __init__(self, iface, importTime=0.):
         """Constructor.
 
         :param iface: An interface instance that will be passed to this class
             which provides the hook by which you can manipulate the QGIS
             application at run time.
         :type iface: QgisInterface
+
+        :param importTime: Seconds spent importing the plugin module.
+        :type importTime: float
         """
+        start = time.perf_counter()
+        # Startup cost of the plugin in seconds, see logStartupTimes
+        self.startupTimes = {"import": importTime}
+        self.overlay_7_tool = None
         # Save reference to the QGIS interface and Kadas interface
         self.iface = KadasPluginInterface.cast(iface)
         # initialize plugin directory
@@ -58,6 +69,7 @@ class OverlayPC7:
                 self.translator = QTranslator()
                 self.translator.load(locale_path)
                 QCoreApplication.installTranslator(self.translator)
+        self.startupTimes["init"] = time.perf_counter() - start
 
     # noinspection PyMethodMayBeStatic
     def tr(self, message):
@@ -76,7 +88,7 @@ class OverlayPC7:
 
     def initGui(self):
         """Create the menu entries and toolbar icons inside the QGIS GUI."""
-
+        start = time.perf_counter()
         icon_path = ':/plugins/OverlayPC7/icon.png'
         icon = QIcon(icon_path)
 
@@ -91,16 +103,41 @@ class OverlayPC7:
         self.pluginLayerType = OverlayPC7LayerType(self.action)
         QgsApplication.pluginLayerRegistry().addPluginLayerType(
             self.pluginLayerType)
+        self.layerRegistry = OverlayPC7LayerRegistry(QgsProject.instance())
+        self.precomputer = OverlayPC7Precomputer(self.iface,
+                                                 self.layerRegistry)
+        QgsProject.instance().transformContextChanged.connect(
+            transformPool.invalidate)
+        self.startupTimes["initGui"] = time.perf_counter() - start
+        self.logStartupTimes()
+
+    def logStartupTimes(self):
+        """Log the startup cost of the plugin if instrumentation is on."""
+        if not overlay_pc7_stats.isEnabled():
+            return
+        QgsMessageLog.logMessage(
+            "Plugin startup took %.1f ms (%s)" % (
+                1000. * sum(self.startupTimes.values()),
+                ", ".join("%s %.1f ms" % (key, 1000. * value)
+                          for key, value in self.startupTimes.items())),
+            "Overlay PC7", Qgis.Info)
 
     def unload(self):
         self.iface.removeAction(self.action, self.iface.PLUGIN_MENU,
                                 self.iface.DRAW_TAB)
         QgsApplication.pluginLayerRegistry().removePluginLayerType(
             self.pluginLayerType.name())
+        self.precomputer.unload()
+        self.layerRegistry.unload()
+        QgsProject.instance().transformContextChanged.disconnect(
+            transformPool.invalidate)
 
     def toolToggled(self, active):
         if active:
-            self.overlay_7_tool = OverlayPC7Tool(self.iface)
+            # Imported on first use, loading the tool compiles the widget UI
+            from .overlay_pc7_tool import OverlayPC7Tool
+            self.overlay_7_tool = OverlayPC7Tool(self.iface,
+                                                 self.layerRegistry)
             self.overlay_7_tool.setAction(self.action)
             self.iface.mapCanvas().setMapTool(self.overlay_7_tool)
         elif self.iface.mapCanvas().mapTool() and self.iface.mapCanvas().mapTool().action() == self.action:
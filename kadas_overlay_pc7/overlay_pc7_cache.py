@@ -0,0 +1,57 @@
+"""
+Cache of pre-rendered overlay images, shared by all PC7 renderers.
+
+For a given scale, rotation, DPI and style, an overlay's pixel footprint
+only translates as the map is panned, so a cached image can be drawn at the
+new position of the overlay center instead of redrawing the geometry.
+"""
+import threading
+from collections import OrderedDict
+
+
+class SymbolCache:
+    """ LRU cache of (image, offset) entries, bounded by the total image
+        size in bytes. Accessed from the render threads. """
+
+    def __init__(self, maxBytes=64 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.bytes = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                return entry[:2]
+            return None
+
+    def insert(self, key, image, offset):
+        size = image.width() * image.height() * 4
+        if size > self.maxBytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self.entries[key] = (image, offset, size)
+            self.bytes += size
+            while self.bytes > self.maxBytes:
+                evicted = self.entries.popitem(last=False)[1]
+                self.bytes -= evicted[2]
+
+    def setMaxBytes(self, maxBytes):
+        with self.lock:
+            self.maxBytes = maxBytes
+            while self.bytes > self.maxBytes:
+                evicted = self.entries.popitem(last=False)[1]
+                self.bytes -= evicted[2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+
+symbolCache = SymbolCache()
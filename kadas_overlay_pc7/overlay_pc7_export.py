@@ -0,0 +1,134 @@
+"""
+Batch export of PC7 overlays to GeoJSON or GeoPackage.
+
+The overlays of any number of OverlayPC7Layers are streamed in chunks: only
+chunkSize overlays are converted to features at a time. Geometries are
+written in WGS84, the ring as polygon and the axis and flight lines as
+lines.
+"""
+from itertools import islice
+
+from qgis.PyQt.QtCore import *
+from qgis.core import *
+
+from .overlay_pc7_geometry import OverlayPC7Definition, partAzimuths, \
+    partsGeometry, writeGeoJson
+from .overlay_pc7_transforms import transformPool
+
+
+CHUNK_SIZE = 500
+
+
+def layerDefinitions(layers):
+    """ Yields an OverlayPC7Definition for each overlay of the layers, with
+        the full detail geometry if the overlay has it cached. Nothing is
+        computed or cached on the layers. """
+    for layer in layers:
+        ct = transformPool.toWgs(layer.crs())
+        for item in list(layer.items):
+            center = ct.transform(item.center)
+            geometry = item.cachedGeometry()
+            yield OverlayPC7Definition(
+                center.x(), center.y(), item.azimut, item.azimutLeftFL,
+                item.azimutRightFL, {
+                    "layer": layer.name(),
+                    "overlay": item.id,
+                    "name": item.name,
+                    "color": item.color.name(),
+                    "lineWidth": item.lineWidth,
+                }, geometry)
+
+
+def exportGeoJson(layers, path):
+    """ Writes the overlays of the layers to a GeoJSON file. Returns the
+        number of exported overlays. """
+    with open(path, "w") as stream:
+        return writeGeoJson(layerDefinitions(layers), stream)
+
+
+def exportGeoPackage(layers, path, chunkSize=CHUNK_SIZE):
+    """ Writes the overlays of the layers to the tables pc7_rings (polygons)
+        and pc7_lines (axes and flight lines) of a GeoPackage. Returns the
+        number of exported overlays, raises IOError on failure. """
+    fields = QgsFields()
+    fields.append(QgsField("layer", QVariant.String))
+    fields.append(QgsField("overlay", QVariant.Int))
+    fields.append(QgsField("name", QVariant.String))
+    fields.append(QgsField("part", QVariant.String))
+    fields.append(QgsField("azimut", QVariant.Double))
+    fields.append(QgsField("azimutLeftFL", QVariant.Double))
+    fields.append(QgsField("azimutRightFL", QVariant.Double))
+    fields.append(QgsField("color", QVariant.String))
+    fields.append(QgsField("lineWidth", QVariant.Int))
+
+    # One table after the other, so that only one writer holds the file.
+    # Each pass only computes the parts of its table.
+    writeTable(layers, path, "pc7_rings", fields, QgsWkbTypes.Polygon,
+               False, chunkSize)
+    return writeTable(layers, path, "pc7_lines", fields,
+                      QgsWkbTypes.LineString, True, chunkSize)
+
+
+def writeTable(layers, path, tableName, fields, wkbType, appendToFile,
+               chunkSize):
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = "GPKG"
+    options.layerName = tableName
+    if appendToFile:
+        options.actionOnExistingFile = \
+            QgsVectorFileWriter.CreateOrOverwriteLayer
+    writer = QgsVectorFileWriter.create(
+        path, fields, wkbType, transformPool.crs(),
+        QgsProject.instance().transformContext(), options)
+    if writer.hasError() != QgsVectorFileWriter.NoError:
+        raise IOError(writer.errorMessage())
+
+    polygon = wkbType == QgsWkbTypes.Polygon
+    count = 0
+    definitions = layerDefinitions(layers)
+    while True:
+        chunk = list(islice(definitions, chunkSize))
+        if not chunk:
+            break
+        features = []
+        for definition in chunk:
+            azimuths = {part: azimuth for part, azimuth in partAzimuths(
+                definition.azimut, definition.azimutLeftFL,
+                definition.azimutRightFL).items()
+                if (part == "ring") == polygon}
+            if definition.geometry is not None:
+                parts = {part: getattr(definition.geometry, part)
+                         for part in azimuths}
+            else:
+                parts = partsGeometry(definition.lon, definition.lat,
+                                      azimuths)
+            properties = definition.properties
+            for part, coords in parts.items():
+                points = [QgsPointXY(x, y) for x, y in coords]
+                feature = QgsFeature(fields)
+                if polygon:
+                    feature.setGeometry(QgsGeometry.fromPolygonXY([points]))
+                else:
+                    feature.setGeometry(QgsGeometry.fromPolylineXY(points))
+                feature.setAttributes([
+                    properties["layer"], properties["overlay"],
+                    properties["name"], part,
+                    definition.azimut, definition.azimutLeftFL,
+                    definition.azimutRightFL, properties["color"],
+                    properties["lineWidth"]])
+                features.append(feature)
+        if not writer.addFeatures(features):
+            raise IOError(writer.errorMessage())
+        count += len(chunk)
+
+    # Deleting the writer flushes and closes the table
+    del writer
+    return count
+
+
+def exportOverlays(layers, path):
+    """ Exports the overlays of the layers to path, as GeoPackage if it
+        ends with .gpkg and as GeoJSON otherwise. """
+    if path.lower().endswith(".gpkg"):
+        return exportGeoPackage(layers, path)
+    return exportGeoJson(layers, path)
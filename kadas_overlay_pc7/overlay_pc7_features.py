@@ -0,0 +1,175 @@
+"""
+Read-only vector layers mirroring the overlays of a PC7 layer.
+
+The rings are exposed as polygons, the axes and flight lines as lines, in
+memory layers with a spatial index, so that they can be queried and
+intersected like any other vector layer. The layers follow the edits of the
+PC7 layer incrementally: only overlays whose geometry revision or style
+changed are rewritten.
+"""
+from qgis.PyQt.QtCore import *
+from qgis.core import *
+
+from .overlay_pc7_geometry import FULL_DETAIL
+from .overlay_pc7_transforms import transformPool
+
+
+SYNC_DELAY = 100  # ms
+LINE_PARTS = ("axis", "leftFlightLine", "rightFlightLine")
+FLIGHT_LINE_PARTS = ("leftFlightLine", "rightFlightLine")
+
+
+class OverlayPC7FeatureLayers(QObject):
+    """ Keeps a ring and a line memory layer in sync with a PC7 layer. """
+
+    def __init__(self, layer):
+        QObject.__init__(self)
+
+        self.layer = layer
+        crs = layer.crs().authid()
+        fields = "&field=overlay:integer&field=name:string&field=part:string" \
+            "&field=azimut:double&field=color:string&field=lineWidth:integer"
+        self.ringLayer = QgsVectorLayer(
+            "Polygon?crs=%s%s&index=yes" % (crs, fields),
+            layer.name() + " - " + self.tr("rings"), "memory")
+        self.lineLayer = QgsVectorLayer(
+            "LineString?crs=%s%s&index=yes" % (crs, fields),
+            layer.name() + " - " + self.tr("lines"), "memory")
+        # (revision, color, lineWidth, name) and feature ids by overlay id
+        self.synced = {}
+
+        self.syncTimer = QTimer(self)
+        self.syncTimer.setSingleShot(True)
+        self.syncTimer.setInterval(SYNC_DELAY)
+        self.syncTimer.timeout.connect(self.sync)
+
+        self.sync()
+        for vectorLayer in [self.ringLayer, self.lineLayer]:
+            vectorLayer.setReadOnly(True)
+            vectorLayer.willBeDeleted.connect(self.detach)
+        layer.overlaysChanged.connect(self.scheduleSync)
+        layer.crsChanged.connect(self.scheduleSync)
+        layer.willBeDeleted.connect(self.detach)
+
+    def layers(self):
+        return [self.ringLayer, self.lineLayer]
+
+    def addToProject(self, project=None):
+        (project or QgsProject.instance()).addMapLayers(self.layers())
+
+    def detach(self):
+        """ Stops following the PC7 layer, the vector layers are kept. """
+        self.syncTimer.stop()
+        try:
+            self.layer.overlaysChanged.disconnect(self.scheduleSync)
+            self.layer.crsChanged.disconnect(self.scheduleSync)
+        except TypeError:
+            pass
+
+    def scheduleSync(self):
+        if not self.syncTimer.isActive():
+            self.syncTimer.start()
+
+    def sync(self):
+        """ Rewrites the features of the overlays which were added, changed
+            or removed since the last sync. """
+        items = {item.id: item for item in list(self.layer.items)}
+        removedRings = []
+        removedLines = []
+        added = []
+        for itemId, (state, ringIds, lineIds) in list(self.synced.items()):
+            item = items.get(itemId)
+            if item is None or self.itemState(item) != state:
+                removedRings.extend(ringIds)
+                removedLines.extend(lineIds)
+                del self.synced[itemId]
+        for itemId, item in items.items():
+            if itemId not in self.synced:
+                added.append(item)
+        if not removedRings and not removedLines and not added:
+            return
+        for vectorLayer in self.layers():
+            if vectorLayer.crs() != self.layer.crs():
+                vectorLayer.setCrs(self.layer.crs())
+
+        rings = []
+        lines = []
+        for item in added:
+            geometry = self.layer.getGeometry(item, FULL_DETAIL)
+            ring = QgsLineString.fromQPolygonF(geometry.ring)
+            ring.close()
+            rings.append(self.feature(
+                self.ringLayer, item, "ring", QgsGeometry(QgsPolygon(ring))))
+            for part in LINE_PARTS:
+                line = QgsLineString.fromQPolygonF(getattr(geometry, part))
+                lines.append(self.feature(self.lineLayer, item, part,
+                                          QgsGeometry(line)))
+
+        ringIds = self.replaceFeatures(self.ringLayer, removedRings, rings)
+        lineIds = self.replaceFeatures(self.lineLayer, removedLines, lines)
+        for i, item in enumerate(added):
+            self.synced[item.id] = (
+                self.itemState(item), [ringIds[i]],
+                lineIds[len(LINE_PARTS) * i:len(LINE_PARTS) * (i + 1)])
+
+    @staticmethod
+    def itemState(item):
+        return (item.revision, item.color.rgba(), item.lineWidth, item.name)
+
+    @staticmethod
+    def feature(vectorLayer, item, part, geometry):
+        azimut = {
+            "axis": item.azimut,
+            "leftFlightLine": item.azimut + item.azimutLeftFL,
+            "rightFlightLine": item.azimut + item.azimutRightFL,
+        }.get(part, item.azimut)
+        feature = QgsFeature(vectorLayer.fields())
+        feature.setGeometry(geometry)
+        feature.setAttributes([item.id, item.name, part, azimut % 360,
+                               item.color.name(), item.lineWidth])
+        return feature
+
+    @staticmethod
+    def replaceFeatures(vectorLayer, removedIds, features):
+        """ Deletes and adds features through the provider, bypassing the
+            read-only layer. Returns the ids of the added features. """
+        provider = vectorLayer.dataProvider()
+        if removedIds:
+            provider.deleteFeatures(removedIds)
+        ids = []
+        if features:
+            ok, features = provider.addFeatures(features)
+            ids = [feature.id() for feature in features]
+        vectorLayer.updateExtents()
+        vectorLayer.triggerRepaint()
+        return ids
+
+
+def flightLineConflicts(featureLayers, obstacleLayer, distance=0.,
+                        parts=FLIGHT_LINE_PARTS):
+    """ Returns (overlay id, part, obstacle feature id) for each obstacle
+        feature within distance (in layer units of the PC7 layer) of the
+        flight lines (or of the given line parts) of the overlays. Obstacles
+        are looked up through the spatial index of obstacleLayer. """
+    lineLayer = featureLayers.lineLayer
+    ct = transformPool.transform(obstacleLayer.crs(), lineLayer.crs())
+    toObstacle = transformPool.transform(lineLayer.crs(),
+                                         obstacleLayer.crs())
+    conflicts = []
+    for line in lineLayer.getFeatures():
+        if line["part"] not in parts:
+            continue
+        geometry = line.geometry()
+        if distance > 0:
+            geometry = geometry.buffer(distance, 8)
+        engine = QgsGeometry.createGeometryEngine(geometry.constGet())
+        engine.prepareGeometry()
+        request = QgsFeatureRequest(
+            toObstacle.transformBoundingBox(geometry.boundingBox()))
+        for obstacle in obstacleLayer.getFeatures(request):
+            obstacleGeometry = obstacle.geometry()
+            obstacleGeometry.transform(ct)
+            if engine.intersects(obstacleGeometry.constGet()):
+                conflicts.append((line["overlay"], line["part"],
+                                  obstacle.id()))
+    return conflicts
@@ -0,0 +1,229 @@
+"""
+Live position and heading feed for PC7 overlays.
+
+Messages are read from a local UDP port or TCP server on a background thread,
+one message per line, either as JSON:
+
+    {"name": "PC7-1", "lon": 7.44, "lat": 46.95, "heading": 270.5}
+
+or as NMEA-like sentence with an optional checksum:
+
+    $PC7,PC7-1,46.95,7.44,270.5*4A
+
+Only the latest message per name is kept. The pending updates are applied in
+the GUI thread at most fps times per second: the overlay with the same name
+is moved to the position (WGS84) and rotated to the heading, and the layer is
+repainted once.
+"""
+import json
+import math
+import socket
+import threading
+import time
+from functools import reduce
+
+from qgis.PyQt.QtCore import *
+from qgis.core import *
+
+from .overlay_pc7_transforms import transformPool
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 10110
+DEFAULT_FPS = 10
+RECONNECT_INTERVAL = 1.  # s
+
+
+def nmeaChecksum(body):
+    return reduce(lambda checksum, char: checksum ^ ord(char), body, 0)
+
+
+def parseMessage(line):
+    """ Returns (name, lon, lat, heading) for a feed message, raises
+        ValueError if it is invalid. """
+    line = line.strip()
+    if line.startswith("$"):
+        body, _, checksum = line[1:].partition("*")
+        if checksum and int(checksum, 16) != nmeaChecksum(body):
+            raise ValueError("checksum mismatch")
+        fields = body.split(",")
+        if len(fields) != 5 or fields[0] != "PC7":
+            raise ValueError("invalid sentence")
+        name, lat, lon, heading = fields[1:]
+    else:
+        message = json.loads(line)
+        if not isinstance(message, dict):
+            raise ValueError("invalid message")
+        name = message.get("name", message.get("id"))
+        lon = message.get("lon", message.get("x"))
+        lat = message.get("lat", message.get("y"))
+        heading = message.get("heading", message.get("azimut"))
+    if name is None or name == "":
+        raise ValueError("missing name")
+    try:
+        lon, lat, heading = float(lon), float(lat), float(heading)
+    except (TypeError, ValueError):
+        raise ValueError("invalid position or heading")
+    if not all(map(math.isfinite, (lon, lat, heading))) or \
+            abs(lat) > 90 or abs(lon) > 180:
+        raise ValueError("invalid position or heading")
+    return str(name), lon, lat, heading % 360
+
+
+class OverlayPC7Feed(QObject):
+    """ Moves the overlays of a layer according to a live feed. """
+
+    # Emitted in the GUI thread with the number of updated overlays
+    updated = pyqtSignal(int)
+    error = pyqtSignal(str)
+
+    def __init__(self, layer, protocol="udp", host=DEFAULT_HOST,
+                 port=DEFAULT_PORT, fps=DEFAULT_FPS):
+        QObject.__init__(self)
+
+        self.layer = layer
+        self.protocol = protocol
+        self.host = host
+        self.port = port
+        self.thread = None
+        self.running = False
+        # Latest (lon, lat, heading) by name, filled by the feed thread
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.errors = []
+        self.invalidMessages = 0
+        # Overlay index by name, rebuilt when it gets stale
+        self.indices = {}
+
+        self.applyTimer = QTimer(self)
+        self.applyTimer.timeout.connect(self.applyUpdates)
+        self.setFrameRate(fps)
+        layer.willBeDeleted.connect(self.stop)
+
+    def setFrameRate(self, fps):
+        """ Limits the layer updates and repaints to fps per second. """
+        self.applyTimer.setInterval(int(1000 / max(fps, 0.1)))
+
+    def isRunning(self):
+        return self.running
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        target = self.receiveUdp if self.protocol == "udp" else \
+            self.receiveTcp
+        self.thread = threading.Thread(target=target, daemon=True,
+                                       name="OverlayPC7Feed")
+        self.thread.start()
+        self.applyTimer.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.applyTimer.stop()
+        self.thread.join()
+        self.thread = None
+        with self.lock:
+            self.pending = {}
+
+    def receiveUdp(self):
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind((self.host, self.port))
+        except OSError as e:
+            self.reportError(str(e))
+            return
+        # The timeout lets the thread notice stop()
+        sock.settimeout(0.5)
+        with sock:
+            while self.running:
+                try:
+                    data = sock.recv(65536)
+                except socket.timeout:
+                    continue
+                except OSError as e:
+                    self.reportError(str(e))
+                    return
+                self.receiveLines(data.decode("utf-8", "replace").splitlines())
+
+    def receiveTcp(self):
+        while self.running:
+            try:
+                sock = socket.create_connection((self.host, self.port),
+                                                timeout=0.5)
+            except OSError:
+                time.sleep(RECONNECT_INTERVAL)
+                continue
+            with sock:
+                buffer = b""
+                while self.running:
+                    try:
+                        data = sock.recv(65536)
+                    except socket.timeout:
+                        continue
+                    except OSError:
+                        break
+                    if not data:
+                        break
+                    lines = (buffer + data).split(b"\n")
+                    buffer = lines.pop()
+                    self.receiveLines(
+                        line.decode("utf-8", "replace") for line in lines)
+
+    def receiveLines(self, lines):
+        updates = {}
+        invalid = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                name, lon, lat, heading = parseMessage(line)
+            except ValueError:
+                invalid += 1
+                continue
+            updates[name] = (lon, lat, heading)
+        with self.lock:
+            self.pending.update(updates)
+            self.invalidMessages += invalid
+
+    def reportError(self, message):
+        with self.lock:
+            self.errors.append(message)
+        self.running = False
+
+    def overlayIndex(self, name):
+        index = self.indices.get(name)
+        items = self.layer.items
+        if index is None or index >= len(items) or items[index].name != name:
+            self.indices = {item.name: i for i, item in enumerate(items)
+                            if item.name}
+            index = self.indices.get(name)
+        return index
+
+    def applyUpdates(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            errors, self.errors = self.errors, []
+        for message in errors:
+            self.applyTimer.stop()
+            self.error.emit(message)
+        if not pending:
+            return
+
+        fromWgs = transformPool.fromWgs(self.layer.crs())
+        count = 0
+        for name, (lon, lat, heading) in pending.items():
+            index = self.overlayIndex(name)
+            if index is None:
+                continue
+            try:
+                center = fromWgs.transform(QgsPointXY(lon, lat))
+            except QgsCsException:
+                continue
+            self.layer.moveOverlay(index, center, heading)
+            count += 1
+        if count:
+            self.layer.triggerRepaint()
+            self.updated.emit(count)
@@ -0,0 +1,74 @@
+"""
+Compact binary format for storing the overlays of a PC7 layer in a project.
+
+The overlays are packed into a single blob, stored base64 encoded in one XML
+element:
+
+    header    magic "PC7O", format version (uint16), overlay count (uint32)
+    records   per overlay: x, y, azimut, azimutLeftFL, azimutRightFL
+              (float64), color as ARGB (uint32), lineWidth (uint16, clamped)
+              and the length of the name in bytes (uint16)
+    names     the UTF-8 encoded names, concatenated
+
+All values are little endian. The module does not depend on Qt or QGIS.
+"""
+import base64
+import struct
+
+import numpy as np
+
+
+MAGIC = b"PC7O"
+VERSION = 1
+HEADER = struct.Struct("<4sHI")
+RECORD = np.dtype([
+    ("x", "<f8"), ("y", "<f8"), ("azimut", "<f8"), ("azimutLeftFL", "<f8"),
+    ("azimutRightFL", "<f8"), ("color", "<u4"), ("lineWidth", "<u2"),
+    ("nameLength", "<u2")])
+
+
+def packOverlays(overlays):
+    """ Packs overlays, a sequence of (x, y, azimut, azimutLeftFL,
+        azimutRightFL, argb, lineWidth, name) tuples, and returns the base64
+        encoded blob as str. """
+    names = [name.encode("utf-8")[:0xffff] for *_, name in overlays]
+    records = np.empty(len(overlays), dtype=RECORD)
+    if overlays:
+        columns = list(zip(*overlays))
+        for field, column in zip(RECORD.names[:-1], columns):
+            if RECORD[field].kind == "u":
+                # Out of range values must not make saving fail
+                info = np.iinfo(RECORD[field])
+                column = np.clip(np.asarray(column, dtype=np.int64),
+                                 info.min, info.max)
+            records[field] = column
+        records["nameLength"] = [len(name) for name in names]
+    data = HEADER.pack(MAGIC, VERSION, len(overlays)) + records.tobytes() + \
+        b"".join(names)
+    return base64.b64encode(data).decode("ascii")
+
+
+def unpackOverlays(text):
+    """ Unpacks a blob written by packOverlays into a list of (x, y, azimut,
+        azimutLeftFL, azimutRightFL, argb, lineWidth, name) tuples. Raises
+        ValueError if the blob is invalid or of an unknown version. """
+    data = base64.b64decode(text)
+    if len(data) < HEADER.size:
+        raise ValueError("truncated overlay data")
+    magic, version, count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not PC7 overlay data")
+    if version != VERSION:
+        raise ValueError("unsupported overlay data version %d" % version)
+    if len(data) < HEADER.size + count * RECORD.itemsize:
+        raise ValueError("truncated overlay data")
+    records = np.frombuffer(data, RECORD, count, HEADER.size)
+    offset = HEADER.size + count * RECORD.itemsize
+    ends = offset + np.cumsum(records["nameLength"], dtype=np.int64)
+    if count and ends[-1] > len(data):
+        raise ValueError("truncated overlay data")
+    starts = np.concatenate([[offset], ends[:-1]]).tolist()
+    names = [data[start:end].decode("utf-8", "replace")
+             for start, end in zip(starts, ends.tolist())]
+    return [record[:-1] + (name,)
+            for record, name in zip(records.tolist(), names)]
@@ -0,0 +1,394 @@
+"""
+Vectorized geodesic computation of the PC7 overlay vertices.
+
+All direct geodesic problems of one overlay (ring, axis and flight lines)
+are solved in a single NumPy pass on the WGS84 ellipsoid, using Vincenty's
+direct formula (the same method as QgsDistanceArea.computeSpheroidProject).
+Coordinates are returned as (n, 2) arrays of lon/lat in degrees.
+
+The module does not depend on Qt or QGIS, so it can be used headless, e.g.
+to stream overlay geometries to GeoJSON with writeGeoJson().
+"""
+import json
+import math
+from collections import namedtuple
+
+import numpy as np
+
+
+WGS84_A = 6378137.
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+
+NAUTICAL_MILE = 1852.
+
+RING_RADIUS = 230.
+RING_SEGMENTS = 360
+AXIS_LENGTH = 1 * NAUTICAL_MILE
+AXIS_SEGMENT = 500.
+FLIGHT_LINE_LENGTH = 1.5 * NAUTICAL_MILE
+FLIGHT_LINE_SEGMENT = 50.
+# The flight lines start two full detail segments away from the center
+FLIGHT_LINE_SKIP = 2
+FLIGHT_LINE_START = FLIGHT_LINE_SKIP * FLIGHT_LINE_SEGMENT
+
+
+FULL_DETAIL = (RING_SEGMENTS, AXIS_SEGMENT, FLIGHT_LINE_SEGMENT)
+# Longest line segment, in units of the max error, when coarsening the axis
+# and flight lines. Their curvature on screen is tiny, so the segment length
+# matters far less than the ring's.
+LINE_SEGMENT_ERROR_RATIO = 32
+
+# Geometry modes: exact geodesics, or a local tangent plane approximation
+# which falls back to exact geodesics beyond its tolerance (meters)
+GEOMETRY_GEODESIC = "geodesic"
+GEOMETRY_TANGENT_PLANE = "tangentPlane"
+TANGENT_PLANE_TOLERANCE = 0.05
+# Ring azimuths at which the tangent plane deviation is sampled
+RING_DEVIATION_SAMPLES = 8
+# Safety factor applied to the sampled worst case deviation
+DEVIATION_MARGIN = 1.5
+
+# Worst case tangent plane deviation by whole degree of latitude
+_deviationBounds = {}
+
+
+# Polylines of one overlay, each an (n, 2) array of lon/lat
+OverlayPC7Geometry = namedtuple(
+    "OverlayPC7Geometry",
+    ["ring", "axis", "leftFlightLine", "rightFlightLine"])
+
+# An overlay centered at lon/lat (degrees) with its azimuts (degrees),
+# arbitrary extra attributes and optionally its full detail geometry, if
+# already known
+OverlayPC7Definition = namedtuple(
+    "OverlayPC7Definition",
+    ["lon", "lat", "azimut", "azimutLeftFL", "azimutRightFL", "properties",
+     "geometry"], defaults=[None])
+
+
+def geodesicDirect(lon, lat, azimuths, distances):
+    """ Solves the direct geodesic problem from lon/lat (degrees) for the
+        given azimuths (degrees) and distances (meters), which are broadcast
+        against each other. Returns the arrays (lon2, lat2) in degrees. """
+    azimuths = np.radians(np.asarray(azimuths, dtype=float))
+    distances = np.asarray(distances, dtype=float)
+    f = WGS84_F
+    b = WGS84_B
+
+    sinAlpha1 = np.sin(azimuths)
+    cosAlpha1 = np.cos(azimuths)
+    tanU1 = (1 - f) * math.tan(math.radians(lat))
+    cosU1 = 1 / math.sqrt(1 + tanU1 * tanU1)
+    sinU1 = tanU1 * cosU1
+    sigma1 = np.arctan2(tanU1, cosAlpha1)
+    sinAlpha = cosU1 * sinAlpha1
+    cosSqAlpha = 1 - sinAlpha * sinAlpha
+    uSq = cosSqAlpha * (WGS84_A * WGS84_A - b * b) / (b * b)
+    A = 1 + uSq / 16384 * (4096 + uSq * (-768 + uSq * (320 - 175 * uSq)))
+    B = uSq / 1024 * (256 + uSq * (-128 + uSq * (74 - 47 * uSq)))
+
+    sigma0 = distances / (b * A)
+    sigma = sigma0
+    for i in range(100):
+        cos2SigmaM = np.cos(2 * sigma1 + sigma)
+        sinSigma = np.sin(sigma)
+        cosSigma = np.cos(sigma)
+        deltaSigma = B * sinSigma * (cos2SigmaM + B / 4 * (
+            cosSigma * (-1 + 2 * cos2SigmaM * cos2SigmaM) -
+            B / 6 * cos2SigmaM * (-3 + 4 * sinSigma * sinSigma) *
+            (-3 + 4 * cos2SigmaM * cos2SigmaM)))
+        sigmaPrev = sigma
+        sigma = sigma0 + deltaSigma
+        if np.all(np.abs(sigma - sigmaPrev) < 1e-12):
+            break
+
+    cos2SigmaM = np.cos(2 * sigma1 + sigma)
+    sinSigma = np.sin(sigma)
+    cosSigma = np.cos(sigma)
+    tmp = sinU1 * sinSigma - cosU1 * cosSigma * cosAlpha1
+    lat2 = np.arctan2(sinU1 * cosSigma + cosU1 * sinSigma * cosAlpha1,
+                      (1 - f) * np.sqrt(sinAlpha * sinAlpha + tmp * tmp))
+    lam = np.arctan2(sinSigma * sinAlpha1,
+                     cosU1 * cosSigma - sinU1 * sinSigma * cosAlpha1)
+    C = f / 16 * cosSqAlpha * (4 + f * (4 - 3 * cosSqAlpha))
+    L = lam - (1 - C) * f * sinAlpha * (sigma + C * sinSigma * (
+        cos2SigmaM + C * cosSigma * (-1 + 2 * cos2SigmaM * cos2SigmaM)))
+    lon2 = (lon + np.degrees(L) + 540.) % 360. - 180.
+    return lon2, np.degrees(lat2)
+
+
+def tangentPlaneDirect(lon, lat, azimuths, distances):
+    """ Approximates geodesicDirect in the local tangent plane at lon/lat,
+        with the curvature terms of second order in the distance. The error
+        grows with the cube of the distance; for overlay distances it stays
+        within a few centimeters up to high latitudes. """
+    azimuths = np.radians(np.asarray(azimuths, dtype=float))
+    distances = np.asarray(distances, dtype=float)
+    phi = math.radians(lat)
+    w = 1. - WGS84_E2 * math.sin(phi) ** 2
+    # Prime vertical and meridional radius of curvature
+    n = WGS84_A / math.sqrt(w)
+    m = WGS84_A * (1. - WGS84_E2) / w ** 1.5
+    tanPhi = math.tan(phi)
+    cosPhi = math.cos(phi)
+    east = distances * np.sin(azimuths)
+    north = distances * np.cos(azimuths)
+    dPhi = north / m - east * east * tanPhi / (2. * m * n)
+    dLambda = east / (n * cosPhi) + east * north * tanPhi / (m * n * cosPhi)
+    lon2 = (lon + np.degrees(dLambda) + 540.) % 360. - 180.
+    return lon2, lat + np.degrees(dPhi)
+
+
+def maxTangentPlaneError(lon, lat, azimuths, distances):
+    """ Returns the largest distance in meters between tangentPlaneDirect
+        and geodesicDirect for the given problems. Both solutions are close
+        to lon/lat, so the distance is measured in its tangent plane. """
+    lon1, lat1 = tangentPlaneDirect(lon, lat, azimuths, distances)
+    lon2, lat2 = geodesicDirect(lon, lat, azimuths, distances)
+    phi = math.radians(lat)
+    w = 1. - WGS84_E2 * math.sin(phi) ** 2
+    north = np.radians(lat1 - lat2) * WGS84_A * (1. - WGS84_E2) / w ** 1.5
+    dLon = (lon1 - lon2 + 540.) % 360. - 180.
+    east = np.radians(dLon) * WGS84_A / math.sqrt(w) * math.cos(phi)
+    return float(np.hypot(east, north).max())
+
+
+def tangentPlaneDeviation(lon, lat, azimuths):
+    """ Returns the deviation in meters of tangentPlaneDirect from
+        geodesicDirect for the overlay parts at lon/lat, with azimuths by
+        part name as from partAzimuths. The deviation is evaluated at the
+        far end of each line and at samples of the ring, where it is
+        largest. """
+    sampleAzimuths = []
+    sampleDistances = []
+    for part, azimuth in azimuths.items():
+        if part == "ring":
+            sampleAzimuths.extend(np.linspace(
+                0., 360., RING_DEVIATION_SAMPLES, endpoint=False))
+            sampleDistances.extend([RING_RADIUS] * RING_DEVIATION_SAMPLES)
+        elif part == "axis":
+            sampleAzimuths.extend([azimuth, azimuth + 180.])
+            sampleDistances.extend([AXIS_LENGTH] * 2)
+        else:
+            sampleAzimuths.append(azimuth)
+            sampleDistances.append(FLIGHT_LINE_LENGTH)
+    return maxTangentPlaneError(lon, lat, sampleAzimuths, sampleDistances)
+
+
+def tangentPlaneBound(lat):
+    """ Returns an upper bound in meters of the deviation of
+        tangentPlaneDirect from geodesicDirect for any overlay centered at
+        latitude lat. The worst case over all azimuths at the longest
+        overlay distance is sampled once per degree of latitude. There is no
+        bound closer than 0.001 degrees to the poles. """
+    if abs(lat) > 89.999:
+        return math.inf
+    band = math.floor(lat)
+    bound = _deviationBounds.get(band)
+    if bound is None:
+        azimuths = np.arange(0., 360., 1.)
+        bound = 0.
+        for bandLat in np.linspace(max(band, -89.999),
+                                   min(band + 1., 89.999), 11):
+            if abs(bandLat) >= 90.:
+                continue
+            bound = max(bound, maxTangentPlaneError(
+                0., bandLat, azimuths, FLIGHT_LINE_LENGTH))
+        bound *= DEVIATION_MARGIN
+        _deviationBounds[band] = bound
+    return bound
+
+
+def lineDistances(length, segment, start=0.):
+    """ Distances of the vertices along a line from start to length meters,
+        sampled every segment meters. The last vertex is placed at the line
+        end, so there are always at least two vertices. """
+    nSegments = max(1, int(math.ceil((length - start) / segment)))
+    return np.minimum(start + np.arange(nSegments + 1) * segment, length)
+
+
+def overlayGeometry(lon, lat, azimut, azimutLeftFL, azimutRightFL,
+                    ringSegments=RING_SEGMENTS, axisSegment=AXIS_SEGMENT,
+                    flightLineSegment=FLIGHT_LINE_SEGMENT,
+                    mode=GEOMETRY_GEODESIC,
+                    tolerance=TANGENT_PLANE_TOLERANCE):
+    """ Computes the WGS84 vertices of an overlay centered at lon/lat with
+        the given axis azimut and flight line angles (relative to the axis),
+        all in degrees. """
+    parts = partsGeometry(lon, lat, partAzimuths(
+        azimut, azimutLeftFL, azimutRightFL),
+        (ringSegments, axisSegment, flightLineSegment), mode, tolerance)
+    return OverlayPC7Geometry(**parts)
+
+
+def partAzimuths(azimut, azimutLeftFL, azimutRightFL):
+    """ Returns the absolute azimuth each overlay part depends on, by part
+        name. The ring does not depend on any azimuth. """
+    return {
+        "ring": None,
+        "axis": azimut % 360.,
+        "leftFlightLine": (azimut + azimutLeftFL) % 360.,
+        "rightFlightLine": (azimut + azimutRightFL) % 360.,
+    }
+
+
+def partsGeometry(lon, lat, azimuths, lod=FULL_DETAIL,
+                  mode=GEOMETRY_GEODESIC, tolerance=TANGENT_PLANE_TOLERANCE):
+    """ Computes the WGS84 vertices of some parts of an overlay centered at
+        lon/lat in one pass. azimuths maps the part names to compute to
+        their absolute azimuth (see partAzimuths). In tangent plane mode,
+        exact geodesics are used if the approximation may deviate by more
+        than tolerance meters. Returns the vertices by part name. """
+    direct = geodesicDirect
+    if mode == GEOMETRY_TANGENT_PLANE and tangentPlaneBound(lat) <= tolerance:
+        direct = tangentPlaneDirect
+
+    ringSegments, axisSegment, flightLineSegment = lod
+    parts = []
+    for part, azimuth in azimuths.items():
+        if part == "ring":
+            distances = np.full(ringSegments + 1, RING_RADIUS)
+            angles = np.linspace(0., 360., ringSegments + 1)
+        elif part == "axis":
+            distances = lineDistances(AXIS_LENGTH, axisSegment)
+            # Backward half from its end to the center, then the forward
+            # half
+            angles = np.concatenate([
+                np.full(len(distances) - 1, azimuth + 180.),
+                np.full(len(distances), azimuth)])
+            distances = np.concatenate([distances[:0:-1], distances])
+        else:
+            distances = lineDistances(FLIGHT_LINE_LENGTH, flightLineSegment,
+                                      FLIGHT_LINE_START)
+            angles = np.full(len(distances), azimuth)
+        parts.append((part, angles, distances))
+
+    lon2, lat2 = direct(
+        lon, lat,
+        np.concatenate([p[1] for p in parts]),
+        np.concatenate([p[2] for p in parts]))
+    coords = np.column_stack([lon2, lat2])
+    splits = np.cumsum([len(p[2]) for p in parts])[:-1]
+    return {p[0]: partCoords
+            for p, partCoords in zip(parts, np.split(coords, splits))}
+
+
+def levelOfDetail(metersPerPixel, maxError):
+    """ Picks the vertex density for an overlay drawn at metersPerPixel so
+        that the polylines deviate by at most maxError pixels from the full
+        detail geometry. Returns (ringSegments, axisSegment,
+        flightLineSegment), quantized to powers of two so that only a few
+        levels are ever cached. """
+    if metersPerPixel <= 0 or maxError <= 0:
+        return FULL_DETAIL
+
+    # Chord error of a ring segment: r * (1 - cos(theta / 2)) <= maxError
+    radius = RING_RADIUS / metersPerPixel
+    if maxError >= radius:
+        ringSegments = 8
+    else:
+        theta = 2 * math.acos(1 - maxError / radius)
+        ringSegments = 2 ** int(math.ceil(math.log2(2 * math.pi / theta)))
+        ringSegments = min(RING_SEGMENTS, max(8, ringSegments))
+
+    maxSegment = LINE_SEGMENT_ERROR_RATIO * maxError * metersPerPixel
+
+    def lineSegment(segment, length):
+        if maxSegment <= segment:
+            return segment
+        segment *= 2 ** int(math.floor(math.log2(maxSegment / segment)))
+        return min(segment, length)
+
+    return (ringSegments, lineSegment(AXIS_SEGMENT, AXIS_LENGTH),
+            lineSegment(FLIGHT_LINE_SEGMENT, FLIGHT_LINE_LENGTH))
+
+
+def overlayExtremePoints(lon, lat, azimut, azimutLeftFL, azimutRightFL,
+                         ringSamples=36):
+    """ Returns the vertices which determine the bounding extent of an
+        overlay: ringSamples points on the ring plus the ends of the axis
+        and of the flight lines, as an (n, 2) array of lon/lat. """
+    azimuths = np.concatenate([
+        np.linspace(0., 360., ringSamples, endpoint=False),
+        [azimut, azimut + 180.],
+        [azimut + azimutLeftFL] * 2,
+        [azimut + azimutRightFL] * 2])
+    distances = np.concatenate([
+        np.full(ringSamples, RING_RADIUS),
+        [AXIS_LENGTH, AXIS_LENGTH],
+        [FLIGHT_LINE_START, FLIGHT_LINE_LENGTH],
+        [FLIGHT_LINE_START, FLIGHT_LINE_LENGTH]])
+    lon2, lat2 = geodesicDirect(lon, lat, azimuths, distances)
+    return np.column_stack([lon2, lat2])
+
+
+def definitionGeometry(definition, lod=FULL_DETAIL):
+    """ Computes the geometry of an OverlayPC7Definition, or returns its
+        geometry if given. """
+    if definition.geometry is not None and lod == FULL_DETAIL:
+        return definition.geometry
+    return overlayGeometry(definition.lon, definition.lat, definition.azimut,
+                           definition.azimutLeftFL, definition.azimutRightFL,
+                           *lod)
+
+
+def geoJsonFeatures(definition, lod=FULL_DETAIL):
+    """ Returns the GeoJSON features of an overlay: the ring as polygon, the
+        axis and the flight lines as line strings. Each feature carries the
+        definition's azimuts and properties plus a "part" property. """
+    geometry = definitionGeometry(definition, lod)
+    properties = {
+        "azimut": definition.azimut,
+        "azimutLeftFL": definition.azimutLeftFL,
+        "azimutRightFL": definition.azimutRightFL,
+    }
+    properties.update(definition.properties or {})
+    features = []
+    for part, coords in zip(OverlayPC7Geometry._fields, geometry):
+        if part == "ring":
+            geom = {"type": "Polygon", "coordinates": [coords.tolist()]}
+        else:
+            geom = {"type": "LineString", "coordinates": coords.tolist()}
+        features.append({
+            "type": "Feature",
+            "properties": dict(properties, part=part),
+            "geometry": geom,
+        })
+    return features
+
+
+def writeGeoJson(definitions, stream, lod=FULL_DETAIL):
+    """ Streams the features of the OverlayPC7Definitions in the iterable
+        definitions as GeoJSON FeatureCollection to the text stream. Only one
+        overlay is held in memory at a time. Returns the number of overlays
+        written. """
+    count = 0
+    separator = ""
+    stream.write('{"type": "FeatureCollection", "features": [\n')
+    for definition in definitions:
+        for feature in geoJsonFeatures(definition, lod):
+            stream.write(separator + json.dumps(feature))
+            separator = ",\n"
+        count += 1
+    stream.write("\n]}\n")
+    return count
+
+
+def polylineDistance(coords, x, y):
+    """ Returns the planar distance from x/y to the polyline coords, an
+        (n, 2) array in the same units. A single vertex is treated as a
+        point, an empty polyline is infinitely far away. """
+    coords = np.reshape(coords, (-1, 2))
+    if len(coords) == 0:
+        return math.inf
+    if len(coords) == 1:
+        return math.hypot(coords[0, 0] - x, coords[0, 1] - y)
+    start = coords[:-1]
+    delta = coords[1:] - start
+    lengths = np.einsum("ij,ij->i", delta, delta)
+    t = np.einsum("ij,ij->i", np.array([x, y]) - start, delta) / \
+        np.where(lengths > 0., lengths, 1.)
+    closest = start + np.clip(t, 0., 1.)[:, np.newaxis] * delta
+    return np.hypot(closest[:, 0] - x, closest[:, 1] - y).min()
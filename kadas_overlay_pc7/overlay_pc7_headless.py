@@ -0,0 +1,87 @@
+"""
+Helpers to use the plugin layer outside of KADAS, e.g. in benchmarks or
+batch jobs run with a plain QGIS installation.
+
+installKadasStub() registers a minimal stand-in for the kadas.kadascore
+module (if KADAS itself is not importable), initQgis() starts a headless
+QgsApplication. Both must be called before importing overlay_pc7_layer.
+registerLayerType() lets projects containing PC7 layers be read.
+"""
+import sys
+import types
+
+from qgis.core import QgsApplication, QgsPluginLayer, QgsPluginLayerType
+
+
+# The layer type registered by registerLayerType
+_layerType = None
+
+class KadasPluginLayer(QgsPluginLayer):
+    """ Stand-in for kadas.kadascore.KadasPluginLayer. """
+
+    def __init__(self, layerType, layerName):
+        QgsPluginLayer.__init__(self, layerType, layerName)
+
+    def clone(self):
+        return None
+
+    def setTransformContext(self, transformContext):
+        pass
+
+
+class KadasPluginLayerType(QgsPluginLayerType):
+    """ Stand-in for kadas.kadascore.KadasPluginLayerType. """
+
+    def tr(self, message):
+        return message
+
+
+class OverlayPC7HeadlessLayerType(QgsPluginLayerType):
+    """ Plugin layer type which only creates layers, without the actions of
+        OverlayPC7LayerType which need the plugin GUI. """
+
+    def __init__(self):
+        from .overlay_pc7_layer_type import OverlayPC7LayerType
+        QgsPluginLayerType.__init__(self, OverlayPC7LayerType.LAYER_TYPE)
+
+    def createLayer(self, uri=None):
+        from .overlay_pc7_layer import OverlayPC7Layer
+        return OverlayPC7Layer("OverlayPC7")
+
+
+def installKadasStub():
+    """ Makes kadas.kadascore importable, using the stand-in classes if
+        KADAS is not installed. Returns True if the stub is used. """
+    try:
+        import kadas.kadascore  # noqa: F401
+        return False
+    except ImportError:
+        pass
+    kadas = types.ModuleType("kadas")
+    kadascore = types.ModuleType("kadas.kadascore")
+    kadascore.KadasPluginLayer = KadasPluginLayer
+    kadascore.KadasPluginLayerType = KadasPluginLayerType
+    kadascore.__all__ = ["KadasPluginLayer", "KadasPluginLayerType"]
+    kadas.kadascore = kadascore
+    sys.modules["kadas"] = kadas
+    sys.modules["kadas.kadascore"] = kadascore
+    return True
+
+
+def initQgis():
+    """ Starts a QgsApplication without GUI, once per process. """
+    app = QgsApplication.instance()
+    if app is None:
+        app = QgsApplication([], False)
+        QgsApplication.initQgis()
+    return app
+
+
+def registerLayerType():
+    """ Registers OverlayPC7HeadlessLayerType with the plugin layer registry,
+        once per process. Returns the registered type. """
+    global _layerType
+    if _layerType is None:
+        _layerType = OverlayPC7HeadlessLayerType()
+        QgsApplication.pluginLayerRegistry().addPluginLayerType(_layerType)
+    return _layerType
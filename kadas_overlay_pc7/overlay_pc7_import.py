@@ -0,0 +1,273 @@
+"""
+Bulk import of PC7 overlays from CSV or GeoJSON.
+
+CSV files have a header row with the columns x and y (or lon and lat),
+azimut and optionally azimutLeftFL, azimutRightFL, color, lineWidth and
+name. GeoJSON files contain point features with the same properties;
+both plain and newline delimited GeoJSON (.geojsonl, .geojsons, .ndjson)
+are read feature by feature.
+
+Rows are validated as they are read. Invalid rows are reported and skipped,
+the valid ones are added to the layer in one batch. Files which cannot be
+read at all are not imported.
+"""
+import csv
+import json
+import math
+
+from qgis.PyQt.QtCore import *
+from qgis.PyQt.QtGui import *
+from qgis.core import *
+
+from .overlay_pc7_layer import OverlayPC7Layer
+from .overlay_pc7_transforms import transformPool
+
+
+DEFAULT_AZIMUT_LEFT_FL = 45
+DEFAULT_AZIMUT_RIGHT_FL = 135
+DEFAULT_LINE_WIDTH = 3
+# The largest line width the editor offers
+MAX_LINE_WIDTH = 99
+
+SEQUENCE_SUFFIXES = (".geojsonl", ".geojsons", ".ndjson")
+
+
+def readCsv(path):
+    """ Yields (line number, row dict) for the rows of a UTF-8 CSV file, or
+        (line number, ValueError) for rows which cannot be read. """
+    badLines = set()
+
+    def decodeLines(stream):
+        for number, line in enumerate(stream, 1):
+            try:
+                yield line.decode("utf-8-sig" if number == 1 else "utf-8")
+            except UnicodeDecodeError:
+                badLines.add(number)
+                yield line.decode("utf-8", "replace")
+
+    with open(path, "rb") as stream:
+        reader = csv.DictReader(decodeLines(stream))
+        lastLine = reader.line_num
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                row = ValueError(str(e))
+            if any(number in badLines
+                   for number in range(lastLine + 1, reader.line_num + 1)):
+                row = ValueError("invalid UTF-8")
+            lastLine = reader.line_num
+            yield reader.line_num, row
+
+
+class JsonStreamReader:
+    """ Reads a JSON text piecewise from a text stream: single values with
+        value(), structural characters with expect(). """
+
+    def __init__(self, stream, chunkSize=65536):
+        self.stream = stream
+        self.chunkSize = chunkSize
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+
+    def fill(self):
+        """ Appends the next chunk, growing with the unread data so that
+            large values are not decoded over and over. Returns False at the
+            end of the stream. """
+        chunk = self.stream.read(max(self.chunkSize,
+                                     len(self.buffer) - self.pos))
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return bool(chunk)
+
+    def peek(self):
+        """ Returns the next non whitespace character, or "" at the end. """
+        while True:
+            while self.pos < len(self.buffer) and \
+                    self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars):
+        """ Consumes and returns the next character, which must be one of
+            chars. Raises ValueError otherwise. """
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError("invalid GeoJSON: expected %s, got %r" % (
+                " or ".join(repr(c) for c in chars), char or "end of file"))
+        self.pos += 1
+        return char
+
+    def value(self):
+        """ Decodes and returns the next value. Raises ValueError. """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if self.fill():
+                    continue
+                raise
+            # A number at the end of the buffer may go on in the next chunk
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def readFeatures(stream):
+    """ Yields the members of the features array of a GeoJSON object one by
+        one, without loading the whole stream. Raises ValueError if it is not
+        a valid JSON object. """
+    reader = JsonStreamReader(stream)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        if not isinstance(key, str):
+            raise ValueError("invalid GeoJSON: invalid member name")
+        reader.expect(":")
+        if key == "features":
+            reader.expect("[")
+            if reader.peek() == "]":
+                return
+            while True:
+                yield reader.value()
+                if reader.expect(",]") == "]":
+                    return
+        reader.value()
+        if reader.expect(",}") == "}":
+            return
+
+
+def readGeoJson(path):
+    """ Yields (feature number, row dict) for the features of a UTF-8
+        GeoJSON file, with the point coordinates as x and y, or (feature
+        number, ValueError) for invalid features. Raises ValueError if the
+        file itself is invalid. """
+    def toRow(feature):
+        if not isinstance(feature, dict):
+            raise ValueError("not a feature")
+        properties = feature.get("properties") or {}
+        geometry = feature.get("geometry") or {}
+        if not isinstance(properties, dict) or \
+                not isinstance(geometry, dict):
+            raise ValueError("invalid properties or geometry")
+        row = dict(properties)
+        if geometry.get("type") == "Point":
+            coordinates = geometry.get("coordinates")
+            if isinstance(coordinates, list) and len(coordinates) >= 2:
+                row["x"], row["y"] = coordinates[0], coordinates[1]
+        return row
+
+    if path.lower().endswith(SEQUENCE_SUFFIXES):
+        with open(path, "rb") as stream:
+            for number, line in enumerate(stream, 1):
+                try:
+                    line = line.decode("utf-8").strip().lstrip("\x1e")
+                    if line:
+                        yield number, toRow(json.loads(line))
+                except ValueError as e:
+                    yield number, e
+    else:
+        with open(path, encoding="utf-8-sig") as stream:
+            for number, feature in enumerate(readFeatures(stream), 1):
+                try:
+                    yield number, toRow(feature)
+                except ValueError as e:
+                    yield number, e
+
+
+def parseNumber(row, keys, default=None):
+    for key in keys:
+        value = row.get(key)
+        if value is not None and value != "":
+            break
+    else:
+        if default is None:
+            raise ValueError("missing %s" % keys[0])
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("invalid %s: %r" % (keys[0], value))
+    if not math.isfinite(number):
+        raise ValueError("invalid %s: %r" % (keys[0], value))
+    return number
+
+
+def parseRow(row):
+    """ Validates a row and returns (x, y, azimut, azimutLeftFL,
+        azimutRightFL, color, lineWidth, name). Raises ValueError. """
+    x = parseNumber(row, ["x", "lon"])
+    y = parseNumber(row, ["y", "lat"])
+    azimut = parseNumber(row, ["azimut"])
+    azimutLeftFL = parseNumber(row, ["azimutLeftFL"], DEFAULT_AZIMUT_LEFT_FL)
+    azimutRightFL = parseNumber(row, ["azimutRightFL"],
+                                DEFAULT_AZIMUT_RIGHT_FL)
+    lineWidth = parseNumber(row, ["lineWidth"], DEFAULT_LINE_WIDTH)
+    if lineWidth < 1 or lineWidth > MAX_LINE_WIDTH or \
+            lineWidth != int(lineWidth):
+        raise ValueError("invalid lineWidth: %r" % row.get("lineWidth"))
+    color = None
+    if row.get("color"):
+        color = QgsSymbolLayerUtils.parseColor(str(row["color"]))
+        if not color.isValid():
+            raise ValueError("invalid color: %r" % row["color"])
+    return (x, y, azimut % 360, azimutLeftFL % 360, azimutRightFL % 360,
+            color, int(lineWidth), str(row.get("name") or ""))
+
+
+def importOverlays(path, layer=None, crs=None, layerName=None):
+    """ Imports the overlays of a CSV or GeoJSON file into layer, or into a
+        new layer added to the project if layer is None. crs is the CRS of
+        the CSV coordinates (default WGS84), GeoJSON is always WGS84.
+
+        Returns (layer, number of imported overlays, errors), where errors
+        is a list of (row number, message). Raises OSError or ValueError if
+        the file cannot be read at all. """
+    wgs84 = transformPool.crs()
+    if path.lower().endswith(".csv"):
+        rows = readCsv(path)
+        crs = crs or wgs84
+    else:
+        rows = readGeoJson(path)
+        crs = wgs84
+
+    newLayer = layer is None
+    if newLayer:
+        layer = OverlayPC7Layer(
+            layerName or QFileInfo(path).completeBaseName())
+        layer.setCrs(crs)
+    ct = transformPool.transform(crs, layer.crs())
+
+    overlays = []
+    errors = []
+    for number, row in rows:
+        try:
+            if isinstance(row, Exception):
+                raise ValueError(str(row))
+            x, y, azimut, azimutLeftFL, azimutRightFL, color, lineWidth, \
+                name = parseRow(row)
+            center = ct.transform(QgsPointXY(x, y))
+        except (ValueError, QgsCsException) as e:
+            errors.append((number, str(e)))
+            continue
+        overlays.append((center, azimut, azimutLeftFL, azimutRightFL, color,
+                         lineWidth, name))
+
+    count = layer.addOverlays(overlays)
+    if layer.getCurrentOverlay() is None and count:
+        layer.setCurrentOverlay(0)
+    if newLayer:
+        QgsProject.instance().addMapLayer(layer)
+    else:
+        layer.triggerRepaint()
+    return layer, count, errors
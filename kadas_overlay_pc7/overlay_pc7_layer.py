@@ -1,7 +1,7 @@
 import os
 import math
 from enum import Enum
-from geographiclib.geodesic import Geodesic
+from itertools import count
 
 from qgis.PyQt.QtCore import *
 from qgis.PyQt.QtGui import *
@@ -10,231 +10,790 @@ from qgis.core import *
 from qgis.gui import *
 from kadas.kadascore import *
 
+import numpy as np
+
+from .overlay_pc7_geometry import OverlayPC7Geometry, partAzimuths, \
+    partsGeometry, overlayExtremePoints, levelOfDetail, polylineDistance, \
+    tangentPlaneBound, FULL_DETAIL, FLIGHT_LINE_LENGTH, GEOMETRY_GEODESIC, \
+    GEOMETRY_TANGENT_PLANE, TANGENT_PLANE_TOLERANCE
+from .overlay_pc7_stats import RenderStats
+from .overlay_pc7_cache import symbolCache
+from .overlay_pc7_transforms import transformPool
+from .overlay_pc7_format import packOverlays, unpackOverlays
+from .overlay_pc7_layer_type import OverlayPC7LayerType
+
+
+# Source of geometry revisions, see OverlayPC7Item.revision
+geometryRevisions = count()
+
+
+class OverlayPC7Item:
+    """ A single overlay of an OverlayPC7Layer. The center is in layer CRS,
+        the azimuts in degrees.
+
+        Items are treated as immutable once added to a layer: edits replace
+        the item by a modified copy, so that renderers running in worker
+        threads keep a consistent snapshot. Only the geometry caches are
+        filled in lazily.
+
+        The geometry is cached per part, together with the azimuth it was
+        computed for: the ring only depends on the center, the axis and the
+        flight lines on the center and their own azimuth. """
+
+    __slots__ = ("id", "center", "azimut", "azimutLeftFL", "azimutRightFL",
+                 "color", "lineWidth", "name", "revision", "geometry",
+                 "bounds")
+
+    def __init__(self, id, center, azimut, azimutLeftFL, azimutRightFL,
+                 color=None, lineWidth=3, name=""):
+        self.id = id
+        self.center = QgsPointXY(center)
+        self.azimut = azimut
+        self.azimutLeftFL = azimutLeftFL  # Azimut left flight line
+        self.azimutRightFL = azimutRightFL  # Azimut right flight line
+        self.color = QColor(color if color is not None else Qt.red)
+        self.lineWidth = lineWidth
+        self.name = name
+        # Changes whenever the geometry changes, shared by copies which keep
+        # the geometry
+        self.revision = next(geometryRevisions)
+        # (azimuth, wgsCoords, mapPolygon) by (part, level of detail),
+        # computed on demand
+        self.geometry = {}
+        # Bounding extent in layer CRS, computed on demand
+        self.bounds = None
+
+    def copy(self, keepGeometry=True):
+        item = OverlayPC7Item(self.id, self.center, self.azimut,
+                              self.azimutLeftFL, self.azimutRightFL,
+                              self.color, self.lineWidth, self.name)
+        if keepGeometry:
+            item.revision = self.revision
+            item.geometry = self.geometry
+            item.bounds = self.bounds
+        return item
+
+    def setAzimuts(self, azimut, azimutLeftFL, azimutRightFL):
+        """ Changes the azimuts of a fresh copy, keeping the cached parts
+            which do not depend on the changed azimuts. """
+        if (azimut, azimutLeftFL, azimutRightFL) == \
+                (self.azimut, self.azimutLeftFL, self.azimutRightFL):
+            return
+        self.azimut = azimut
+        self.azimutLeftFL = azimutLeftFL
+        self.azimutRightFL = azimutRightFL
+        azimuths = partAzimuths(azimut, azimutLeftFL, azimutRightFL)
+        # Render threads may still be adding parts to the shared cache
+        self.geometry = {key: value for key, value in list(
+            self.geometry.items()) if value[0] == azimuths[key[0]]}
+        self.revision = next(geometryRevisions)
+        self.bounds = None
+
+    def hasGeometry(self, lod):
+        """ Returns whether all parts are cached at the level of detail lod.
+            """
+        azimuths = partAzimuths(self.azimut, self.azimutLeftFL,
+                                self.azimutRightFL)
+        for part, azimuth in azimuths.items():
+            cached = self.geometry.get((part, lod))
+            if cached is None or cached[0] != azimuth:
+                return False
+        return True
+
+    def cachedGeometry(self, lod=FULL_DETAIL):
+        """ Returns the cached geometry at the level of detail lod as lon/lat
+            arrays, or None if not all parts are cached. Computes nothing.
+            """
+        azimuths = partAzimuths(self.azimut, self.azimutLeftFL,
+                                self.azimutRightFL)
+        geometry = self.geometry
+        parts = {}
+        for part, azimuth in azimuths.items():
+            cached = geometry.get((part, lod))
+            if cached is None or cached[0] != azimuth:
+                return None
+            parts[part] = cached[1]
+        return OverlayPC7Geometry(**parts)
+
+    def getBounds(self, toWgs, fromWgs):
+        """ Returns the geodesic bounding extent in layer CRS, without
+            computing the full geometry. toWgs and fromWgs transform between
+            the layer CRS and WGS84. """
+        if self.bounds is None:
+            wgsCenter = toWgs.transform(self.center)
+            poly = toLayerPolygon(fromWgs, overlayExtremePoints(
+                wgsCenter.x(), wgsCenter.y(), self.azimut, self.azimutLeftFL,
+                self.azimutRightFL))
+            self.bounds = QgsRectangle(poly.boundingRect())
+        return self.bounds
+
+    def getGeometry(self, toWgs, fromWgs, lod=FULL_DETAIL, wgs=False,
+                    mode=GEOMETRY_GEODESIC, tolerance=TANGENT_PLANE_TOLERANCE):
+        """ Returns the geometry at the level of detail lod as QPolygonFs in
+            layer CRS (or as lon/lat arrays if wgs is True), computing and
+            caching it if necessary. mode and tolerance select the geometry
+            computation, see partsGeometry. """
+        azimuths = partAzimuths(self.azimut, self.azimutLeftFL,
+                                self.azimutRightFL)
+        parts = {}
+        missing = {}
+        for part, azimuth in azimuths.items():
+            cached = self.geometry.get((part, lod))
+            if cached is not None and cached[0] == azimuth:
+                parts[part] = cached
+            else:
+                missing[part] = azimuth
+        if missing:
+            wgsCenter = toWgs.transform(self.center)
+            wgsParts = partsGeometry(wgsCenter.x(), wgsCenter.y(), missing,
+                                     lod, mode, tolerance)
+            for part, coords in wgsParts.items():
+                parts[part] = (missing[part], coords,
+                               toLayerPolygon(fromWgs, coords))
+                self.geometry[(part, lod)] = parts[part]
+        return OverlayPC7Geometry(**{
+            part: cached[1 if wgs else 2] for part, cached in parts.items()})
+
+
+def toLayerPolygon(fromWgs, coords):
+    """ Transforms an (n, 2) array of lon/lat to a QPolygonF with fromWgs.
+        """
+    poly = QPolygonF([QPointF(x, y) for x, y in coords])
+    fromWgs.transformPolygon(poly)
+    return poly
+
 
 class OverlayPC7Layer(KadasPluginLayer):
 
+    # Emitted in the GUI thread when overlays were added, removed, moved or
+    # restyled
+    overlaysChanged = pyqtSignal()
+
     def __init__(self, layer_name):
         KadasPluginLayer.__init__(self, self.layerTypeKey(), layer_name)
 
         self.setValid(True)
-        self.center = QgsPointXY()
-        self.azimut = None
-        self.azimutLeftFL = None  # Azimut left flight line
-        self.azimutRightFL = None  # Azimut right flight line
-        self.color = Qt.red
-        self.lineWidth = 3
+        self.items = []
+        self.currentIndex = -1
+        self.nextItemId = 0
         self.transparency = 0
         self.layer_name = layer_name
+        # Level of detail: vertex density follows the on-screen size, overlays
+        # smaller than lodMarkerSize pixels are drawn as a marker
+        self.lodEnabled = True
+        self.lodMaxError = 0.5
+        self.lodMarkerSize = 6
+        # Draw overlays from pre-rendered images while panning
+        self.symbolCacheEnabled = False
+        # Geometry computation, see setGeometryMode
+        self.geometryMode = GEOMETRY_GEODESIC
+        self.geometryTolerance = TANGENT_PLANE_TOLERANCE
+        # Set while the geometry is computed in the background (see
+        # overlay_pc7_precompute), overlays which are not ready yet are
+        # drawn as markers
+        self.precomputing = False
+        # Spatial index of the overlay bounds by item id, built on demand and
+        # then updated with the changed overlays, and the position in items
+        # by item id
+        self.spatialIndex = None
+        self.itemPositions = None
+        # Union of the overlay bounds, computed on demand
+        self.cachedExtent = None
+        self.renderStats = RenderStats(self.statsName)
+
+    def statsName(self):
+        """ Label of the logged render statistics. """
+        return "%s (%s)" % (self.name(), self.id())
 
     @classmethod
     def layerType(self):
-        return "overlaypc7"
+        return OverlayPC7LayerType.LAYER_TYPE
 
     def layerTypeKey(self):
-        return "overlaypc7"
+        return OverlayPC7LayerType.LAYER_TYPE
 
     def setup(self, center, crs, azimut, azimutLeftFL, azimutRightFL):
-        self.center = center
-        self.azimut = azimut
-        self.azimutLeftFL = azimutLeftFL
-        self.azimutRightFL = azimutRightFL
-
-        self.setCrs(crs, False)
+        """ Sets up the current overlay, creating it if the layer is empty.
+            """
+        item = self.getCurrentOverlay()
+        if item is None:
+            self.setCrs(crs, False)
+            self.setCurrentOverlay(self.addOverlay(
+                center, azimut, azimutLeftFL, azimutRightFL))
+            return
+        if crs != self.crs():
+            if len(self.items) == 1:
+                self.setCrs(crs, False)
+                item = self.getCurrentOverlay()
+            else:
+                center = transformPool.transform(
+                    crs, self.crs()).transform(center)
+        # Only the parts depending on what changed are recomputed
+        center = QgsPointXY(center)
+        item = item.copy(center == item.center)
+        item.center = center
+        item.setAzimuts(azimut, azimutLeftFL, azimutRightFL)
+        previous = self.items[self.currentIndex]
+        self.items[self.currentIndex] = item
+        self.overlaysModified([(previous, item)])
+
+    def addOverlay(self, center, azimut, azimutLeftFL, azimutRightFL,
+                   color=None, lineWidth=3, name=""):
+        """ Adds an overlay centered at center (in layer CRS) and returns its
+            index. """
+        item = OverlayPC7Item(
+            self.nextItemId, center, azimut, azimutLeftFL, azimutRightFL,
+            color, lineWidth, name)
+        self.items.append(item)
+        self.nextItemId += 1
+        self.overlaysModified([(None, item)])
+        return len(self.items) - 1
+
+    def addOverlays(self, overlays):
+        """ Adds many overlays at once. overlays is an iterable of tuples of
+            addOverlay arguments. Returns the number of added overlays. """
+        items = []
+        for overlay in overlays:
+            items.append(OverlayPC7Item(self.nextItemId, *overlay))
+            self.nextItemId += 1
+        self.items.extend(items)
+        self.overlaysModified([(None, item) for item in items])
+        return len(items)
+
+    def moveOverlay(self, index, center, azimut):
+        """ Moves the overlay at index to center (in layer CRS) and rotates
+            its axis to azimut, keeping the flight line angles. """
+        item = self.items[index]
+        center = QgsPointXY(center)
+        moved = item.copy(center == item.center)
+        moved.center = center
+        moved.setAzimuts(azimut, item.azimutLeftFL, item.azimutRightFL)
+        self.items[index] = moved
+        self.overlaysModified([(item, moved)])
+
+    def removeOverlay(self, index):
+        item = self.items.pop(index)
+        if self.currentIndex >= len(self.items):
+            self.currentIndex = len(self.items) - 1
+        self.overlaysModified([(item, None)])
+
+    def overlaysModified(self, changes=None):
+        """ Called after the overlay positions or geometry changed. changes
+            lists the (old, new) items if only some overlays were replaced,
+            appended (old is None) or removed (new is None), so that the
+            spatial index is updated with them instead of being rebuilt. """
+        self.cachedExtent = None
+        if changes is None:
+            self.spatialIndex = None
+            self.itemPositions = None
+        else:
+            self.updateSpatialIndex(changes)
+        self.overlaysChanged.emit()
+
+    def updateSpatialIndex(self, changes):
+        """ Applies overlaysModified changes to the spatial index and the
+            item positions, if they were built. """
+        if any(new is None for old, new in changes):
+            # Removing shifts the positions of the following overlays
+            self.itemPositions = None
+        elif self.itemPositions is not None:
+            for old, new in changes:
+                if old is None:
+                    self.itemPositions[new.id] = len(self.itemPositions)
+        if self.spatialIndex is None:
+            return
+        toWgs, fromWgs = self.wgsTransforms()
+        for old, new in changes:
+            if old is not None:
+                feature = QgsFeature(old.id)
+                if old.bounds is not None:
+                    feature.setGeometry(QgsGeometry.fromRect(old.bounds))
+                if old.bounds is None or \
+                        not self.spatialIndex.deleteFeature(feature):
+                    # Not indexed as expected, start over
+                    self.spatialIndex = None
+                    return
+            if new is not None:
+                self.spatialIndex.addFeature(new.id,
+                                             new.getBounds(toWgs, fromWgs))
+
+    def overlayCount(self):
+        return len(self.items)
+
+    def getOverlay(self, index):
+        return self.items[index]
+
+    def setCurrentOverlay(self, index):
+        self.currentIndex = index
+
+    def getCurrentIndex(self):
+        return self.currentIndex
+
+    def getCurrentOverlay(self):
+        if 0 <= self.currentIndex < len(self.items):
+            return self.items[self.currentIndex]
+        return None
 
     def createMapRenderer(self, rendererContext):
         return Renderer(self, rendererContext)
 
     def extent(self):
-        radius = 230
-        radius *= QgsUnitTypes.fromUnitToUnitFactor(
-            QgsUnitTypes.DistanceMeters, self.crs().mapUnits())
-
-        return QgsRectangle(self.center.x() - radius, self.center.y() - radius,
-                            self.center.x() + radius, self.center.y() + radius)
+        if self.cachedExtent is None:
+            toWgs, fromWgs = self.wgsTransforms()
+            extent = QgsRectangle()
+            for item in self.items:
+                extent.combineExtentWith(item.getBounds(toWgs, fromWgs))
+            self.cachedExtent = extent
+        return QgsRectangle(self.cachedExtent)
+
+    def setCrs(self, crs, emitSignal=True):
+        KadasPluginLayer.setCrs(self, crs, emitSignal)
+        self.invalidateGeometry()
+
+    def invalidateGeometry(self):
+        self.items = [item.copy(False) for item in self.items]
+        self.overlaysModified()
+
+    def overlaysIn(self, rect):
+        """ Returns the indices of the overlays whose bounds intersect rect
+            (in layer CRS), in drawing order. """
+        if self.spatialIndex is None:
+            self.spatialIndex = QgsSpatialIndex()
+            toWgs, fromWgs = self.wgsTransforms()
+            for item in self.items:
+                self.spatialIndex.addFeature(item.id,
+                                             item.getBounds(toWgs, fromWgs))
+        if self.itemPositions is None:
+            self.itemPositions = {item.id: index
+                                  for index, item in enumerate(self.items)}
+        return sorted(self.itemPositions[itemId]
+                      for itemId in self.spatialIndex.intersects(rect))
+
+    def overlayAt(self, point, tolerance, lod=FULL_DETAIL):
+        """ Returns the index of the topmost overlay whose ring contains
+            point or whose axis or flight lines pass within tolerance of it
+            (point and tolerance in layer CRS), or -1. """
+        x, y = point.x(), point.y()
+        rect = QgsRectangle(x - tolerance, y - tolerance, x + tolerance,
+                            y + tolerance)
+        for index in reversed(self.overlaysIn(rect)):
+            geometry = self.getGeometry(self.items[index], lod)
+            if geometry.ring.containsPoint(QPointF(x, y), Qt.OddEvenFill):
+                return index
+            for poly in geometry:
+                coords = np.array([(p.x(), p.y()) for p in poly])
+                if polylineDistance(coords, x, y) <= tolerance:
+                    return index
+        return -1
+
+    def getBounds(self, item):
+        """ Returns the geodesic bounding extent of the overlay item in layer
+            CRS, without computing its full geometry. """
+        if item.bounds is not None:
+            return item.bounds
+        return item.getBounds(*self.wgsTransforms())
+
+    def getGeometry(self, item, lod=FULL_DETAIL, wgs=False):
+        """ Returns the geometry of the overlay item at the level of detail
+            lod as QPolygonFs in layer CRS (or as lon/lat arrays if wgs is
+            True), computing and caching it if necessary. """
+        return item.getGeometry(*self.wgsTransforms(), lod=lod, wgs=wgs,
+                                mode=self.geometryMode,
+                                tolerance=self.geometryTolerance)
+
+    def wgsTransforms(self, transformContext=None):
+        """ Returns the transforms from layer CRS to WGS84 and back. """
+        return (transformPool.toWgs(self.crs(), transformContext),
+                transformPool.fromWgs(self.crs(), transformContext))
 
     def azimutToRadiant(self, azimut):
         return (azimut / 180) * math.pi
 
     def getCenter(self):
-        return self.center
+        return self.getCurrentOverlay().center
 
     def getAzimut(self, radiant=False):
+        azimut = self.getCurrentOverlay().azimut
         if radiant:
-            return self.azimutToRadiant(self.azimut)
-        return self.azimut
+            return self.azimutToRadiant(azimut)
+        return azimut
 
     def getAzimutLeftFL(self, radiant=False):
+        azimutLeftFL = self.getCurrentOverlay().azimutLeftFL
         if radiant:
-            return self.azimutToRadiant(self.azimutLeftFL)
-        return self.azimutLeftFL
+            return self.azimutToRadiant(azimutLeftFL)
+        return azimutLeftFL
 
     def getAzimutRightFL(self, radiant=False):
+        azimutRightFL = self.getCurrentOverlay().azimutRightFL
         if radiant:
-            return self.azimutToRadiant(self.azimutRightFL)
-        return self.azimutRightFL
+            return self.azimutToRadiant(azimutRightFL)
+        return azimutRightFL
 
     def getColor(self):
-        return self.color
+        return self.getCurrentOverlay().color
 
     def getLineWidth(self):
-        return self.lineWidth
+        return self.getCurrentOverlay().lineWidth
 
     def setColor(self, color):
-        self.color = color
+        item = self.getCurrentOverlay().copy()
+        item.color = QColor(color)
+        self.items[self.currentIndex] = item
+        self.overlaysChanged.emit()
 
     def setLineWidth(self, lineWidth):
-        self.lineWidth = lineWidth
+        item = self.getCurrentOverlay().copy()
+        item.lineWidth = lineWidth
+        self.items[self.currentIndex] = item
+        self.overlaysChanged.emit()
+
+    def setLevelOfDetail(self, enabled, maxError=0.5, markerSize=6):
+        """ Enables scale dependent vertex density with the given max error
+            in pixels. Overlays smaller than markerSize pixels are collapsed
+            to a marker. """
+        self.lodEnabled = enabled
+        self.lodMaxError = maxError
+        self.lodMarkerSize = markerSize
+
+    def setGeometryMode(self, mode, tolerance=TANGENT_PLANE_TOLERANCE):
+        """ Selects exact geodesics (GEOMETRY_GEODESIC) or the local tangent
+            plane approximation (GEOMETRY_TANGENT_PLANE) for the overlay
+            geometry. Overlays for which the approximation may deviate by
+            more than tolerance meters use exact geodesics. """
+        if (mode, tolerance) != (self.geometryMode, self.geometryTolerance):
+            self.geometryMode = mode
+            self.geometryTolerance = tolerance
+            self.invalidateGeometry()
+
+    def geometryDeviation(self):
+        """ Returns (maximum deviation in meters of the overlays computed in
+            the tangent plane, number of overlays using exact geodesics). """
+        if self.geometryMode != GEOMETRY_TANGENT_PLANE:
+            return 0., len(self.items)
+        toWgs = self.wgsTransforms()[0]
+        deviation = 0.
+        exact = 0
+        for item in list(self.items):
+            bound = tangentPlaneBound(toWgs.transform(item.center).y())
+            if bound <= self.geometryTolerance:
+                deviation = max(deviation, bound)
+            else:
+                exact += 1
+        return deviation, exact
+
+    def setSymbolCacheEnabled(self, enabled):
+        """ Enables drawing the overlays from cached pre-rendered images. """
+        self.symbolCacheEnabled = enabled
 
     def readXml(self, layer_node, context):
         layerEl = layer_node.toElement()
         self.layer_name = layerEl.attribute("title")
         self.transparency = int(layerEl.attribute("transparency"))
-        self.center.setX(float(layerEl.attribute("x")))
-        self.center.setY(float(layerEl.attribute("y")))
-        self.azimut = float(layerEl.attribute("azimut"))
-        self.azimutLeftFL = float(layerEl.attribute("azimutLeftFL"))
-        self.azimutRightFL = float(layerEl.attribute("azimutRightFL"))
-        self.color = QgsSymbolLayerUtils.decodeColor(layerEl.attribute(
-            "color"))
-        self.lineWidth = int(layerEl.attribute("lineWidth"))
-
-        self.setCrs(QgsCoordinateReferenceSystem(layerEl.attribute("crs")))
+        self.lodEnabled = layerEl.attribute("lod", "1") == "1"
+        self.lodMaxError = float(layerEl.attribute("lodMaxError", "0.5"))
+        self.lodMarkerSize = float(layerEl.attribute("lodMarkerSize", "6"))
+        self.symbolCacheEnabled = layerEl.attribute("symbolCache", "0") == "1"
+        self.geometryMode = layerEl.attribute("geometryMode",
+                                              GEOMETRY_GEODESIC)
+        self.geometryTolerance = float(layerEl.attribute(
+            "geometryTolerance", str(TANGENT_PLANE_TOLERANCE)))
+        self.setCrs(transformPool.crs(layerEl.attribute("crs")))
+
+        self.items = []
+        packedEl = layerEl.firstChildElement("overlays")
+        if not packedEl.isNull():
+            try:
+                overlays = unpackOverlays(packedEl.text())
+            except ValueError as e:
+                QgsMessageLog.logMessage(
+                    "%s: %s" % (self.layer_name, e), "Overlay PC7",
+                    Qgis.Critical)
+                return False
+            colors = {}
+            for x, y, azimut, azimutLeftFL, azimutRightFL, argb, lineWidth, \
+                    name in overlays:
+                color = colors.get(argb)
+                if color is None:
+                    color = colors[argb] = QColor.fromRgba(argb)
+                self.items.append(OverlayPC7Item(
+                    self.nextItemId, QgsPointXY(x, y), azimut, azimutLeftFL,
+                    azimutRightFL, color, lineWidth, name))
+                self.nextItemId += 1
+            self.overlaysModified()
+            self.currentIndex = 0 if self.items else -1
+            return True
+
+        # Overlay elements, or a single overlay layer written by older plugin
+        # versions
+        overlayEls = layerEl.elementsByTagName("overlay")
+        if overlayEls.isEmpty():
+            self.readOverlayXml(layerEl, legacy=True)
+        for i in range(overlayEls.count()):
+            self.readOverlayXml(overlayEls.at(i).toElement())
+        self.overlaysModified()
+        self.currentIndex = 0 if self.items else -1
         return True
 
+    def readOverlayXml(self, overlayEl, legacy=False):
+        """ Adds the overlay of an overlay element. A legacy layer element
+            has no overlay name, its name attribute is the layer type. """
+        self.addOverlay(
+            QgsPointXY(float(overlayEl.attribute("x")),
+                       float(overlayEl.attribute("y"))),
+            float(overlayEl.attribute("azimut")),
+            float(overlayEl.attribute("azimutLeftFL")),
+            float(overlayEl.attribute("azimutRightFL")),
+            QgsSymbolLayerUtils.decodeColor(overlayEl.attribute("color")),
+            int(overlayEl.attribute("lineWidth")),
+            "" if legacy else overlayEl.attribute("name"))
+
     def writeXml(self, layer_node, document, context):
         layerEl = layer_node.toElement()
         layerEl.setAttribute("type", "plugin")
         layerEl.setAttribute("name", self.layerTypeKey())
         layerEl.setAttribute("title", self.layer_name)
         layerEl.setAttribute("transparency", self.transparency)
-        layerEl.setAttribute("x", self.center.x())
-        layerEl.setAttribute("y", self.center.y())
-        layerEl.setAttribute("azimut", self.azimut)
-        layerEl.setAttribute("azimutLeftFL", self.azimutLeftFL)
-        layerEl.setAttribute("azimutRightFL", self.azimutRightFL)
         layerEl.setAttribute("crs", self.crs().authid())
-        layerEl.setAttribute("color", QgsSymbolLayerUtils.encodeColor(
-            self.color))
-        layerEl.setAttribute("lineWidth", self.getLineWidth())
+        layerEl.setAttribute("lod", 1 if self.lodEnabled else 0)
+        layerEl.setAttribute("lodMaxError", self.lodMaxError)
+        layerEl.setAttribute("lodMarkerSize", self.lodMarkerSize)
+        layerEl.setAttribute("symbolCache",
+                             1 if self.symbolCacheEnabled else 0)
+        layerEl.setAttribute("geometryMode", self.geometryMode)
+        layerEl.setAttribute("geometryTolerance", self.geometryTolerance)
+        # All overlays packed into one element, see overlay_pc7_format
+        overlaysEl = document.createElement("overlays")
+        overlaysEl.appendChild(document.createTextNode(packOverlays([
+            (item.center.x(), item.center.y(), item.azimut,
+             item.azimutLeftFL, item.azimutRightFL, item.color.rgba(),
+             item.lineWidth, item.name) for item in self.items])))
+        layerEl.appendChild(overlaysEl)
         return True
 
 
 class Renderer(QgsMapLayerRenderer):
+
+    # Overlays larger than this many pixels are not rasterized
+    MAX_SYMBOL_SIZE = 2048
+
     def __init__(self, layer, rendererContext):
         QgsMapLayerRenderer.__init__(self, layer.id())
 
-        self.layer = layer
+        # Renderers run in worker threads while the layer may be edited from
+        # the GUI thread, so everything needed is snapshotted here
         self.rendererContext = rendererContext
-        self.geod = Geodesic.WGS84
-        self.mDa = QgsDistanceArea()
-
-        self.mDa.setEllipsoid("WGS84")
-        self.mDa.setSourceCrs(QgsCoordinateReferenceSystem("EPSG:4326"),
-                              QgsProject.instance().transformContext())
+        self.items = list(layer.items)
+        self.crs = QgsCoordinateReferenceSystem(layer.crs())
+        self.transparency = layer.transparency
+        self.lodEnabled = layer.lodEnabled
+        self.lodMaxError = layer.lodMaxError
+        self.lodMarkerSize = layer.lodMarkerSize
+        self.symbolCacheEnabled = layer.symbolCacheEnabled
+        self.geometryMode = (layer.geometryMode, layer.geometryTolerance)
+        self.precomputing = layer.precomputing
+        self.toWgs, self.fromWgs = layer.wgsTransforms(
+            rendererContext.transformContext())
+        self.stats = layer.renderStats
 
     def render(self):
-        mapToPixel = self.rendererContext.mapToPixel()
-        self.rendererContext.painter().save()
-        self.rendererContext.painter().setOpacity((
-            100. - self.layer.transparency) / 100.)
-        self.rendererContext.painter().setCompositionMode(
-            QPainter.CompositionMode_Source)
-        self.rendererContext.painter().setPen(
-            QPen(self.layer.color, self.layer.lineWidth))
-
-        ct = QgsCoordinateTransform(self.layer.crs(),
-                                    QgsCoordinateReferenceSystem("EPSG:4326"),
-                                    QgsProject.instance())
-        rct = QgsCoordinateTransform(QgsCoordinateReferenceSystem("EPSG:4326"),
-                                     self.layer.crs(),
-                                     QgsProject.instance())
-
-        # draw rings
-        wgsCenter = ct.transform(self.layer.center)
-
-        radMeters = 230
-        poly = QPolygonF()
-        for a in range(361):
-            wgsPoint = self.mDa.computeSpheroidProject(
-                wgsCenter, radMeters, self.layer.azimutToRadiant(a))
-            mapPoint = rct.transform(wgsPoint)
-            poly.append(mapToPixel.transform(mapPoint).toQPointF())
-        path = QPainterPath()
-        path.addPolygon(poly)
-        self.rendererContext.painter().drawPath(path)
-
-        # draw axes
-        axisRadiusMeters = 1 * QgsUnitTypes.fromUnitToUnitFactor(
-            QgsUnitTypes.DistanceNauticalMiles, QgsUnitTypes.DistanceMeters)
-        bearing = self.layer.getAzimut(True)
-        for counter in range(2):
-            wgsPoint = self.mDa.computeSpheroidProject(wgsCenter,
-                                                       axisRadiusMeters,
-                                                       bearing)
-            line = self.geod.InverseLine(wgsCenter.y(), wgsCenter.x(),
-                                         wgsPoint.y(), wgsPoint.x())
-            dist = line.s13
-            sdist = 500
-            nSegments = max(1, int(math.ceil(dist / sdist)))
-            poly = QPolygonF()
-            for iseg in range(nSegments + 1):
-                coords = line.Position(iseg * sdist)
-                mapPoint = rct.transform(
-                    QgsPointXY(coords["lon2"], coords["lat2"]))
-                poly.append(mapToPixel.transform(mapPoint).toQPointF())
-            line.Position(dist)
-            mapPoint = rct.transform(QgsPointXY(
-                coords["lon2"], coords["lat2"]))
-            poly.append(mapToPixel.transform(mapPoint).toQPointF())
-            path = QPainterPath()
-            path.addPolygon(poly)
-            self.rendererContext.painter().drawPath(path)
-            bearing = self.layer.getAzimut(True) + self.layer.azimutToRadiant(
-                180)
+        record = self.stats.createRecord()
+        ct = self.rendererContext.coordinateTransform()
+        if not ct.isValid() or ct.isShortCircuited():
+            ct = None
+        pixelTransform = self.pixelTransform()
+        painter = self.rendererContext.painter()
+
+        painter.save()
+        painter.setOpacity((100. - self.transparency) / 100.)
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+
+        lod = FULL_DETAIL
+        markerSize = 0
+        if self.lodEnabled:
+            metersPerPixel = self.metersPerPixel()
+            lod = levelOfDetail(metersPerPixel, self.lodMaxError)
+            if FLIGHT_LINE_LENGTH / metersPerPixel < self.lodMarkerSize:
+                markerSize = self.lodMarkerSize
+        symbolKey = self.symbolKey(ct, lod) if self.symbolCacheEnabled \
+            else None
+
+        extent = self.rendererContext.extent()
+        for item in self.items:
+            if self.rendererContext.renderingStopped():
+                break
+            if self.precomputing and not item.hasGeometry(lod):
+                # Not ready yet, drawn once computed in the background
+                if item.bounds is None and extent.contains(item.center) or \
+                        item.bounds is not None and \
+                        item.bounds.intersects(extent):
+                    record.overlays += 1
+                    self.drawMarker(ct, pixelTransform, item,
+                                    self.lodMarkerSize)
+                    record.lap("paint")
+                continue
+            bounds = item.getBounds(self.toWgs, self.fromWgs)
+            if not bounds.intersects(extent):
+                continue
+            record.overlays += 1
+            if markerSize:
+                self.drawMarker(ct, pixelTransform, item, markerSize)
+                record.lap("paint")
+                continue
+            if symbolKey and self.drawCachedSymbol(
+                    ct, pixelTransform, item, lod, symbolKey, record):
+                continue
+
+            if item.hasGeometry(lod):
+                record.cacheHits += 1
+            else:
+                record.cacheMisses += 1
+            geometry = item.getGeometry(self.toWgs, self.fromWgs, lod,
+                                        False, *self.geometryMode)
+            record.lap("geometry")
+            self.drawOverlay(painter, ct, pixelTransform, item, geometry,
+                             extent, record)
+
+        painter.restore()
+        self.stats.record(record)
+        return not self.rendererContext.renderingStopped()
+
+    def drawOverlay(self, painter, ct, pixelTransform, item, geometry,
+                    extent, record):
+        """ Draws the parts of the overlay geometry which intersect extent
+            (in layer CRS, None to draw all parts). """
+        # draw ring and axis
+        painter.setPen(QPen(item.color, item.lineWidth))
+        for poly in [geometry.ring, geometry.axis]:
+            self.drawPolyline(painter, ct, pixelTransform, extent, poly,
+                              record)
 
         # draw flight lines
-        self.rendererContext.painter().setPen(QPen(
-            self.layer.color, self.layer.lineWidth, Qt.DashLine))
-        lineRadiusMeters = 1.5 * QgsUnitTypes.fromUnitToUnitFactor(
-            QgsUnitTypes.DistanceNauticalMiles, QgsUnitTypes.DistanceMeters)
-        for bearing in [self.layer.getAzimutLeftFL(True),
-                        self.layer.getAzimutRightFL(True)]:
-            wgsPoint = self.mDa.computeSpheroidProject(
-                wgsCenter, lineRadiusMeters, self.layer.getAzimut(
-                    True) + bearing)
-            line = self.geod.InverseLine(wgsCenter.y(), wgsCenter.x(),
-                                         wgsPoint.y(), wgsPoint.x())
-            dist = line.s13
-            sdist = 50
-            nSegments = max(1, int(math.ceil(dist / sdist)))
-            poly = QPolygonF()
-            for iseg in range(nSegments + 1):
-                if iseg in range(2):
-                    continue
-                coords = line.Position(iseg * sdist)
-                mapPoint = rct.transform(
-                    QgsPointXY(coords["lon2"], coords["lat2"]))
-                poly.append(mapToPixel.transform(mapPoint).toQPointF())
-            line.Position(dist)
-            mapPoint = rct.transform(
-                QgsPointXY(coords["lon2"], coords["lat2"]))
-            poly.append(mapToPixel.transform(mapPoint).toQPointF())
-            path = QPainterPath()
-            path.addPolygon(poly)
-            self.rendererContext.painter().drawPath(path)
-
-        self.rendererContext.painter().restore()
+        painter.setPen(QPen(item.color, item.lineWidth, Qt.DashLine))
+        for poly in [geometry.leftFlightLine, geometry.rightFlightLine]:
+            self.drawPolyline(painter, ct, pixelTransform, extent, poly,
+                              record)
+
+    def symbolKey(self, ct, lod):
+        """ Returns the part of the symbol cache key shared by all overlays
+            of this render. """
+        mapToPixel = self.rendererContext.mapToPixel()
+        # The canvas recomputes the map units per pixel from the extent when
+        # panning, which changes them in the last bits
+        return (self.crs.authid(),
+                ct.destinationCrs().authid() if ct else "",
+                float("%.9g" % mapToPixel.mapUnitsPerPixel()),
+                round(mapToPixel.mapRotation(), 6),
+                self.rendererContext.scaleFactor(), lod)
+
+    def drawCachedSymbol(self, ct, pixelTransform, item, lod, symbolKey,
+                         record):
+        """ Draws the overlay from the symbol cache, rasterizing it first if
+            necessary. Returns False if the overlay is too large to be
+            cached. """
+        key = symbolKey + (item.revision, item.color.rgba(), item.lineWidth)
+        center = ct.transform(item.center) if ct else item.center
+        centerPixel = pixelTransform.map(center.toQPointF())
+
+        entry = symbolCache.get(key)
+        if entry is not None:
+            record.cacheHits += 1
+        else:
+            record.cacheMisses += 1
+            geometry = item.getGeometry(self.toWgs, self.fromWgs, lod,
+                                        False, *self.geometryMode)
+            record.lap("geometry")
+            entry = self.rasterize(ct, pixelTransform, item, geometry,
+                                   centerPixel, record)
+            if entry is None:
+                return False
+            symbolCache.insert(key, *entry)
+
+        image, offset = entry
+        painter = self.rendererContext.painter()
+        painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
+        painter.drawImage(centerPixel + offset, image)
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        record.lap("paint")
         return True
 
-
-class OverlayPC7LayerType(KadasPluginLayerType):
-    def __init__(self, actionPC7Layer):
-        KadasPluginLayerType.__init__(self, OverlayPC7Layer.layerType())
-        self.actionEditLayer = QAction(QIcon(":/images/themes/default/mActionToggleEditing.svg"), self.tr("Edit"), self)
-        self.actionEditLayer.triggered.connect(lambda: actionPC7Layer.trigger())
-
-    def createLayer(self, uri=None):
-        return OverlayPC7Layer("OverlayPC7")
-
-    def addLayerTreeMenuActions(self, menu, layer):
-        menu.addAction( self.actionEditLayer )
+    def rasterize(self, ct, pixelTransform, item, geometry, centerPixel,
+                  record):
+        """ Renders the overlay into an image. Returns (image, offset of the
+            image origin from the center pixel), or None if the overlay is
+            too large. """
+        polygons = []
+        for poly in geometry:
+            if ct:
+                poly = QPolygonF(poly)
+                ct.transformPolygon(poly)
+            polygons.append(pixelTransform.map(poly))
+        record.lap("transform")
+
+        rect = QRectF()
+        for poly in polygons:
+            rect = rect.united(poly.boundingRect())
+        margin = item.lineWidth + 1
+        rect = rect.adjusted(-margin, -margin, margin, margin).toAlignedRect()
+        if max(rect.width(), rect.height()) > self.MAX_SYMBOL_SIZE:
+            return None
+
+        image = QImage(rect.size(), QImage.Format_ARGB32_Premultiplied)
+        image.fill(Qt.transparent)
+        painter = QPainter(image)
+        painter.setRenderHint(
+            QPainter.Antialiasing, bool(self.rendererContext.flags() &
+                                        QgsRenderContext.Antialiasing))
+        painter.translate(-rect.topLeft())
+        self.drawOverlay(painter, None, QTransform(), item,
+                         OverlayPC7Geometry(*polygons), None, record)
+        painter.end()
+        return image, QPointF(rect.topLeft()) - centerPixel
+
+    def metersPerPixel(self):
+        ct = self.rendererContext.coordinateTransform()
+        crs = ct.destinationCrs() if ct.isValid() else self.crs
+        return self.rendererContext.mapToPixel().mapUnitsPerPixel() * \
+            QgsUnitTypes.fromUnitToUnitFactor(
+                crs.mapUnits(), QgsUnitTypes.DistanceMeters)
+
+    def pixelTransform(self):
+        """ Returns the map to pixel conversion as affine QTransform, so that
+            whole polygons can be mapped in one call. """
+        mapToPixel = self.rendererContext.mapToPixel()
+        center = self.rendererContext.mapExtent().center()
+        origin = mapToPixel.transform(center.x(), center.y())
+        unitX = mapToPixel.transform(center.x() + 1, center.y())
+        unitY = mapToPixel.transform(center.x(), center.y() + 1)
+        m11 = unitX.x() - origin.x()
+        m12 = unitX.y() - origin.y()
+        m21 = unitY.x() - origin.x()
+        m22 = unitY.y() - origin.y()
+        return QTransform(
+            m11, m12, m21, m22,
+            origin.x() - m11 * center.x() - m21 * center.y(),
+            origin.y() - m12 * center.x() - m22 * center.y())
+
+    def drawMarker(self, ct, pixelTransform, item, size):
+        center = ct.transform(item.center) if ct else item.center
+        painter = self.rendererContext.painter()
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(item.color)
+        painter.drawEllipse(pixelTransform.map(center.toQPointF()),
+                            0.5 * size, 0.5 * size)
+        painter.setBrush(Qt.NoBrush)
+
+    def drawPolyline(self, painter, ct, pixelTransform, extent, poly, record):
+        if extent is not None and \
+                not QgsRectangle(poly.boundingRect()).intersects(extent):
+            return
+        if ct:
+            poly = QPolygonF(poly)
+            ct.transformPolygon(poly)
+        record.lap("transform")
+        path = QPainterPath()
+        path.addPolygon(pixelTransform.map(poly))
+        record.lap("mapToPixel")
+        painter.drawPath(path)
+        record.vertices += len(poly)
+        record.lap("paint")
@@ -0,0 +1,37 @@
+from qgis.PyQt.QtGui import *
+from qgis.PyQt.QtWidgets import *
+from kadas.kadascore import *
+
+
+class OverlayPC7LayerType(KadasPluginLayerType):
+    """ Registered at startup. The layer implementation (and its geometry
+        dependencies) is only imported once a layer is created. """
+
+    LAYER_TYPE = "overlaypc7"
+
+    def __init__(self, actionPC7Layer):
+        KadasPluginLayerType.__init__(self, self.LAYER_TYPE)
+        self.actionEditLayer = QAction(QIcon(":/images/themes/default/mActionToggleEditing.svg"), self.tr("Edit"), self)
+        self.actionEditLayer.triggered.connect(lambda: actionPC7Layer.trigger())
+        # Vector layers created from PC7 layers, by layer id
+        self.featureLayers = {}
+
+    def createLayer(self, uri=None):
+        from .overlay_pc7_layer import OverlayPC7Layer
+        return OverlayPC7Layer("OverlayPC7")
+
+    def addLayerTreeMenuActions(self, menu, layer):
+        menu.addAction( self.actionEditLayer )
+        menu.addAction(self.tr("Create vector layers"),
+                       lambda: self.createFeatureLayers(layer))
+
+    def createFeatureLayers(self, layer):
+        """ Adds read-only vector layers following the overlays of layer to
+            the project. """
+        from .overlay_pc7_features import OverlayPC7FeatureLayers
+        featureLayers = OverlayPC7FeatureLayers(layer)
+        featureLayers.addToProject()
+        previous = self.featureLayers.get(layer.id())
+        if previous is not None:
+            previous.detach()
+        self.featureLayers[layer.id()] = featureLayers
@@ -0,0 +1,184 @@
+"""
+Background computation of the overlay geometry of newly loaded PC7 layers.
+
+When layers are added to the project (typically when a project is opened),
+their bounds and geometry at the canvas' level of detail are computed in a
+thread pool. Until a layer is done, its renderer draws overlays whose
+geometry is not ready as markers instead of computing it, so the first
+paint does not wait for the geometry. If the canvas' level of detail changes
+meanwhile (the extent is restored or the user zooms), the remaining work is
+resubmitted for the new level.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from qgis.PyQt.QtCore import *
+from qgis.PyQt.QtWidgets import *
+from qgis.core import *
+
+
+CHUNK_SIZE = 100
+POLL_INTERVAL = 200  # ms
+# Progress is only shown for at least this many overlays
+PROGRESS_THRESHOLD = 500
+
+
+def computeChunk(items, toWgs, fromWgs, lod, mode, tolerance):
+    """ Fills the bounds and the geometry caches of the items. """
+    for item in items:
+        item.getBounds(toWgs, fromWgs)
+        if lod is not None:
+            item.getGeometry(toWgs, fromWgs, lod, False, mode, tolerance)
+    return len(items)
+
+
+class OverlayPC7Precomputer(QObject):
+
+    def __init__(self, iface, layerRegistry):
+        QObject.__init__(self)
+
+        self.iface = iface
+        self.layerRegistry = layerRegistry
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, (os.cpu_count() or 2) - 1),
+            thread_name_prefix="OverlayPC7Precompute")
+        # (layer, level of detail, [(future, chunk size)]) by layer id
+        self.pending = {}
+        self.total = 0
+        self.done = 0
+        self.messageItem = None
+        self.progressBar = None
+
+        self.pollTimer = QTimer(self)
+        self.pollTimer.setInterval(POLL_INTERVAL)
+        self.pollTimer.timeout.connect(self.poll)
+        layerRegistry.overlayLayersAdded.connect(self.precompute)
+
+    def unload(self):
+        self.layerRegistry.overlayLayersAdded.disconnect(self.precompute)
+        self.pollTimer.stop()
+        for layerId, (layer, lod, futures) in self.pending.items():
+            for future, size in futures:
+                future.cancel()
+            layer.precomputing = False
+        self.pending = {}
+        self.executor.shutdown(wait=False)
+        self.hideProgress()
+
+    def levelOfDetail(self, layer):
+        """ Returns the level of detail the canvas will render layer at, or
+            None if its overlays will be drawn as markers. """
+        # Imported here to keep NumPy off the plugin startup path
+        from .overlay_pc7_geometry import levelOfDetail, FULL_DETAIL, \
+            FLIGHT_LINE_LENGTH
+        if not layer.lodEnabled:
+            return FULL_DETAIL
+        canvas = self.iface.mapCanvas()
+        metersPerPixel = canvas.mapUnitsPerPixel() * \
+            QgsUnitTypes.fromUnitToUnitFactor(
+                canvas.mapSettings().destinationCrs().mapUnits(),
+                QgsUnitTypes.DistanceMeters)
+        if metersPerPixel <= 0:
+            return FULL_DETAIL
+        if FLIGHT_LINE_LENGTH / metersPerPixel < layer.lodMarkerSize:
+            return None
+        return levelOfDetail(metersPerPixel, layer.lodMaxError)
+
+    def precompute(self, layers):
+        for layer in layers:
+            if layer.id() in self.pending or not layer.items:
+                continue
+            lod = self.levelOfDetail(layer)
+            futures = self.submit(layer, list(layer.items), lod)
+            layer.precomputing = True
+            layer.willBeDeleted.connect(self.layerDeleted)
+            self.pending[layer.id()] = (layer, lod, futures)
+        if self.pending and not self.pollTimer.isActive():
+            self.pollTimer.start()
+        if self.total >= PROGRESS_THRESHOLD:
+            self.showProgress()
+
+    def submit(self, layer, items, lod):
+        """ Submits the computation of items in chunks and returns the list
+            of (future, chunk size). """
+        futures = []
+        for start in range(0, len(items), CHUNK_SIZE):
+            chunk = items[start:start + CHUNK_SIZE]
+            # Every task gets its own copy of the transforms
+            toWgs, fromWgs = layer.wgsTransforms()
+            futures.append((self.executor.submit(
+                computeChunk, chunk, toWgs, fromWgs, lod, layer.geometryMode,
+                layer.geometryTolerance), len(chunk)))
+        self.total += len(items)
+        return futures
+
+    def followLevelOfDetail(self, layerId):
+        """ Resubmits the items of a pending layer which are not ready at the
+            canvas' current level of detail, if it changed. """
+        layer, lod, futures = self.pending[layerId]
+        currentLod = self.levelOfDetail(layer)
+        if currentLod == lod:
+            return
+        # Running chunks complete, queued ones are replaced
+        remaining = []
+        for future, size in futures:
+            if future.cancel():
+                self.total -= size
+            else:
+                remaining.append((future, size))
+        items = [item for item in layer.items if item.bounds is None or
+                 currentLod is not None and not item.hasGeometry(currentLod)]
+        self.pending[layerId] = (layer, currentLod,
+                                 remaining + self.submit(layer, items,
+                                                         currentLod))
+
+    def layerDeleted(self):
+        layer = self.sender()
+        for layerId, (pendingLayer, lod, futures) in \
+                list(self.pending.items()):
+            if pendingLayer is layer:
+                for future, size in futures:
+                    future.cancel()
+                del self.pending[layerId]
+
+    def poll(self):
+        for layerId in list(self.pending):
+            self.followLevelOfDetail(layerId)
+            layer, lod, futures = self.pending[layerId]
+            finished = [(future, size) for future, size in futures
+                        if future.done()]
+            for future, size in finished:
+                futures.remove((future, size))
+                if not future.cancelled():
+                    self.done += future.result()
+            if not futures:
+                del self.pending[layerId]
+                layer.willBeDeleted.disconnect(self.layerDeleted)
+                layer.precomputing = False
+            if finished:
+                # Draw what is ready
+                layer.triggerRepaint()
+        if self.progressBar:
+            self.progressBar.setMaximum(self.total)
+            self.progressBar.setValue(self.done)
+        if not self.pending:
+            self.pollTimer.stop()
+            self.hideProgress()
+            self.total = 0
+            self.done = 0
+
+    def showProgress(self):
+        if self.messageItem is None:
+            self.messageItem = self.iface.messageBar().createMessage(
+                self.tr("Overlay PC7"), self.tr("Computing overlays"))
+            self.progressBar = QProgressBar()
+            self.messageItem.layout().addWidget(self.progressBar)
+            self.iface.messageBar().pushWidget(self.messageItem, Qgis.Info)
+        self.progressBar.setMaximum(self.total)
+        self.progressBar.setValue(self.done)
+
+    def hideProgress(self):
+        if self.messageItem is not None:
+            self.iface.messageBar().popWidget(self.messageItem)
+            self.messageItem = None
+            self.progressBar = None
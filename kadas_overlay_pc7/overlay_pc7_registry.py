@@ -0,0 +1,56 @@
+from qgis.PyQt.QtCore import *
+from qgis.core import *
+
+from .overlay_pc7_layer_type import OverlayPC7LayerType
+
+
+class OverlayPC7LayerRegistry(QObject):
+    """ Index of the PC7 layers of a project, kept up to date from the
+        project's layersAdded/layersWillBeRemoved signals so that lookups
+        never scan all project layers. """
+
+    # Emitted with the PC7 layers among layers added to the project
+    overlayLayersAdded = pyqtSignal(list)
+
+    def __init__(self, project):
+        QObject.__init__(self)
+
+        self.project = project
+        # Layer id -> layer, in insertion order
+        self.layersById = {}
+        self.layersAdded(project.mapLayers().values())
+        project.layersAdded.connect(self.layersAdded)
+        project.layersWillBeRemoved.connect(self.layersWillBeRemoved)
+
+    def unload(self):
+        self.project.layersAdded.disconnect(self.layersAdded)
+        self.project.layersWillBeRemoved.disconnect(self.layersWillBeRemoved)
+        self.layersById = {}
+
+    @staticmethod
+    def isOverlayPC7Layer(layer):
+        return isinstance(layer, QgsPluginLayer) and \
+            layer.pluginLayerType() == OverlayPC7LayerType.LAYER_TYPE
+
+    def layersAdded(self, layers):
+        added = []
+        for layer in layers:
+            if self.isOverlayPC7Layer(layer):
+                self.layersById[layer.id()] = layer
+                added.append(layer)
+        if added:
+            self.overlayLayersAdded.emit(added)
+
+    def layersWillBeRemoved(self, layers):
+        for layer in layers:
+            layerId = layer if isinstance(layer, str) else layer.id()
+            self.layersById.pop(layerId, None)
+
+    def contains(self, layer):
+        return layer is not None and layer.id() in self.layersById
+
+    def layers(self):
+        return list(self.layersById.values())
+
+    def firstLayer(self):
+        return next(iter(self.layersById.values()), None)
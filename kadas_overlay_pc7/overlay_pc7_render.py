@@ -0,0 +1,223 @@
+"""
+Headless batch rendering of PC7 overlay map products.
+
+Renders a project (.qgs/.qgz, all visible layers) or the overlays of a CSV
+or GeoJSON file (see overlay_pc7_import) to PNG, JPEG or SVG images, one per
+job of a jobs file. Jobs are distributed over a pool of worker processes,
+each of which loads the source once. Run with a QGIS Python environment:
+
+    python3 -m kadas_overlay_pc7.overlay_pc7_render --project plan.qgz \\
+        --jobs jobs.csv --output-dir images
+
+The jobs file is CSV, or JSON (a list of objects), with the columns:
+
+    output                  image file name, the format follows the suffix
+    xmin, ymin, xmax, ymax  extent, or
+    x, y, scale             center and scale
+    crs                     map CRS (default: project or WGS84)
+    width, height, dpi      image size (default 1920 x 1080 at 96 dpi)
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+
+DEFAULT_WIDTH = 1920
+DEFAULT_HEIGHT = 1080
+DEFAULT_DPI = 96
+
+# Per worker process: the loaded project, or the error which prevented
+# loading it
+_project = None
+_initError = None
+
+
+def readJobs(path):
+    """ Returns the jobs of a CSV or JSON jobs file as list of dicts. """
+    with open(path, newline="") as stream:
+        if path.lower().endswith(".json"):
+            return json.load(stream)
+        return list(csv.DictReader(stream))
+
+
+def initWorker(projectPath, overlaysPath):
+    """ Starts QGIS in a worker process and loads the source. Errors are
+        kept and reported by renderJob: a pool initializer which raises
+        would be restarted over and over. """
+    global _initError
+    try:
+        loadSource(projectPath, overlaysPath)
+    except Exception as e:
+        _initError = "failed to load the source: %s" % e
+
+
+def loadSource(projectPath, overlaysPath):
+    """ Starts QGIS and loads the project or the overlays file. """
+    global _project
+    from .overlay_pc7_headless import installKadasStub, initQgis, \
+        registerLayerType
+    installKadasStub()
+    initQgis()
+
+    from qgis.core import QgsProject
+    from .overlay_pc7_import import importOverlays
+
+    registerLayerType()
+    _project = QgsProject.instance()
+    if projectPath:
+        if not _project.read(projectPath):
+            raise IOError("Failed to read %s: %s" % (
+                projectPath, _project.error()))
+    else:
+        layer, count, errors = importOverlays(overlaysPath)
+        _project.setCrs(layer.crs())
+
+
+def jobSettings(job):
+    """ Returns the QgsMapSettings for a job. """
+    from qgis.PyQt.QtCore import QSize
+    from qgis.PyQt.QtGui import QColor
+    from qgis.core import QgsCoordinateReferenceSystem, QgsMapSettings, \
+        QgsRectangle, QgsUnitTypes
+
+    crs = QgsCoordinateReferenceSystem(job["crs"]) if job.get("crs") else \
+        _project.crs()
+    width = int(job.get("width") or DEFAULT_WIDTH)
+    height = int(job.get("height") or DEFAULT_HEIGHT)
+    dpi = float(job.get("dpi") or DEFAULT_DPI)
+    if job.get("scale"):
+        # Size of the image on the ground, in map units
+        factor = float(job["scale"]) * 0.0254 / dpi * \
+            QgsUnitTypes.fromUnitToUnitFactor(QgsUnitTypes.DistanceMeters,
+                                              crs.mapUnits())
+        x, y = float(job["x"]), float(job["y"])
+        extent = QgsRectangle(
+            x - 0.5 * width * factor, y - 0.5 * height * factor,
+            x + 0.5 * width * factor, y + 0.5 * height * factor)
+    else:
+        extent = QgsRectangle(float(job["xmin"]), float(job["ymin"]),
+                              float(job["xmax"]), float(job["ymax"]))
+
+    root = _project.layerTreeRoot()
+    visible = set(root.checkedLayers())
+    settings = QgsMapSettings()
+    settings.setLayers([layer for layer in root.layerOrder()
+                        if layer in visible])
+    settings.setDestinationCrs(crs)
+    settings.setOutputSize(QSize(width, height))
+    settings.setOutputDpi(dpi)
+    settings.setBackgroundColor(QColor(255, 255, 255))
+    settings.setTransformContext(_project.transformContext())
+    settings.setExtent(extent)
+    return settings
+
+
+def renderJob(job, outputDir):
+    """ Renders a job and returns (output path, render time in ms, error).
+        Raises RuntimeError if the worker failed to load the source. """
+    if _initError is not None:
+        raise RuntimeError(_initError)
+    from qgis.PyQt.QtCore import QRect
+    from qgis.PyQt.QtGui import QImage, QPainter
+    from qgis.PyQt.QtSvg import QSvgGenerator
+    from qgis.core import QgsMapRendererCustomPainterJob
+
+    path = os.path.join(outputDir, job.get("output") or "")
+    try:
+        settings = jobSettings(job)
+        size = settings.outputSize()
+        if path.lower().endswith(".svg"):
+            device = QSvgGenerator()
+            device.setFileName(path)
+            device.setSize(size)
+            device.setViewBox(QRect(0, 0, size.width(), size.height()))
+            device.setResolution(int(settings.outputDpi()))
+        else:
+            device = QImage(size, QImage.Format_ARGB32_Premultiplied)
+            device.setDotsPerMeterX(int(settings.outputDpi() / 0.0254))
+            device.setDotsPerMeterY(int(settings.outputDpi() / 0.0254))
+            device.fill(settings.backgroundColor())
+
+        start = time.perf_counter()
+        painter = QPainter(device)
+        renderer = QgsMapRendererCustomPainterJob(settings, painter)
+        renderer.renderSynchronously()
+        painter.end()
+        elapsed = 1000. * (time.perf_counter() - start)
+
+        if isinstance(device, QImage) and not device.save(path):
+            raise IOError("failed to write %s" % path)
+        return path, elapsed, None
+    except Exception as e:
+        return path, None, str(e) or type(e).__name__
+
+
+def renderJobs(jobs, projectPath, overlaysPath, outputDir, processes):
+    """ Renders the jobs and yields their results as they complete. """
+    if processes <= 1:
+        loadSource(projectPath, overlaysPath)
+        for job in jobs:
+            yield renderJob(job, outputDir)
+        return
+    # Qt is not fork safe, workers start from scratch. An init error
+    # raised by renderJob ends the iteration and terminates the pool.
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes, initWorker,
+                      (projectPath, overlaysPath)) as pool:
+        yield from pool.imap_unordered(
+            _renderJob, [(job, outputDir) for job in jobs])
+
+
+def _renderJob(args):
+    return renderJob(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().split("\n")[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--project", help="project file (.qgs, .qgz)")
+    source.add_argument("--overlays", help="overlay file (CSV, GeoJSON)")
+    parser.add_argument("--jobs", required=True,
+                        help="jobs file (CSV or JSON)")
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--processes", type=int,
+                        default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    jobs = readJobs(args.jobs)
+    os.makedirs(args.output_dir, exist_ok=True)
+    start = time.perf_counter()
+    times = []
+    failed = 0
+    try:
+        for path, elapsed, error in renderJobs(
+                jobs, args.project, args.overlays, args.output_dir,
+                max(1, min(args.processes, len(jobs)))):
+            if error:
+                failed += 1
+                print("%s: failed: %s" % (path, error), flush=True)
+            else:
+                times.append(elapsed)
+                print("%s: %.1f ms" % (path, elapsed), flush=True)
+    except Exception as e:
+        print("error: %s" % e, file=sys.stderr)
+        return 1
+
+    print("%d images, %d failed, %.1f s total" % (
+        len(times), failed, time.perf_counter() - start), file=sys.stderr)
+    if times:
+        print("render time per image: mean %.1f ms, median %.1f ms, "
+              "max %.1f ms" % (statistics.mean(times),
+                               statistics.median(times), max(times)),
+              file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
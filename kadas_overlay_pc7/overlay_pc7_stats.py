@@ -0,0 +1,145 @@
+"""
+Render instrumentation for OverlayPC7Layer.
+
+Disabled by default. Enable it with setEnabled(True) (or by setting the
+"overlaypc7/instrumentation" setting to true), then read the rolling
+statistics of a layer with layer.renderStats.summary(). Summaries are also
+logged to the QGIS message log every LOG_INTERVAL renders.
+"""
+import threading
+import time
+from collections import deque
+
+from qgis.PyQt.QtCore import QSettings
+from qgis.core import Qgis, QgsMessageLog
+
+
+PHASES = ("geometry", "transform", "mapToPixel", "paint")
+LOG_INTERVAL = 50
+
+_enabled = None
+
+
+def isEnabled():
+    global _enabled
+    if _enabled is None:
+        _enabled = QSettings().value("overlaypc7/instrumentation", False,
+                                     type=bool)
+    return _enabled
+
+
+def setEnabled(enabled):
+    global _enabled
+    _enabled = enabled
+
+
+class RenderRecord:
+    """ Timings and counters of a single render. Time is attributed with
+        lap(): the time since the previous lap goes to the given phase. """
+
+    __slots__ = ("phases", "vertices", "overlays", "cacheHits",
+                 "cacheMisses", "start", "last", "total")
+
+    def __init__(self):
+        self.phases = dict.fromkeys(PHASES, 0.)
+        self.vertices = 0
+        self.overlays = 0
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.start = self.last = time.perf_counter()
+        self.total = 0.
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] += now - self.last
+        self.last = now
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+
+
+class NullRenderRecord:
+    """ Used while instrumentation is disabled, records nothing. """
+
+    vertices = overlays = cacheHits = cacheMisses = 0
+
+    def lap(self, phase):
+        pass
+
+    def finish(self):
+        pass
+
+
+class RenderStats:
+    """ Rolling statistics over the last window renders of a layer. Renders
+        are recorded from the render threads. name labels the logged
+        summaries, a callable is called each time so that it follows
+        renames. """
+
+    def __init__(self, name, window=100):
+        self.name = name
+        self.lock = threading.Lock()
+        self.records = deque(maxlen=window)
+        self.renderCount = 0
+
+    def createRecord(self):
+        return RenderRecord() if isEnabled() else NullRenderRecord()
+
+    def record(self, record):
+        if not isinstance(record, RenderRecord):
+            return
+        record.finish()
+        with self.lock:
+            self.records.append(record)
+            self.renderCount += 1
+            log = self.renderCount % LOG_INTERVAL == 0
+        if log:
+            self.log()
+
+    def reset(self):
+        with self.lock:
+            self.records.clear()
+            self.renderCount = 0
+
+    def summary(self):
+        """ Returns the statistics over the recorded window as dict, times
+            in milliseconds. """
+        with self.lock:
+            records = list(self.records)
+            renderCount = self.renderCount
+        count = len(records)
+        if not count:
+            return {"renders": renderCount, "window": 0}
+        totals = sorted(r.total for r in records)
+        hits = sum(r.cacheHits for r in records)
+        lookups = hits + sum(r.cacheMisses for r in records)
+        return {
+            "renders": renderCount,
+            "window": count,
+            "meanMs": 1000. * sum(totals) / count,
+            "maxMs": 1000. * totals[-1],
+            "p95Ms": 1000. * totals[int(0.95 * (count - 1))],
+            "phasesMs": dict(
+                (phase, 1000. * sum(r.phases[phase] for r in records) / count)
+                for phase in PHASES),
+            "overlays": sum(r.overlays for r in records) / count,
+            "vertices": sum(r.vertices for r in records) / count,
+            "cacheHitRate": hits / lookups if lookups else None,
+        }
+
+    def log(self):
+        summary = self.summary()
+        if not summary["window"]:
+            return
+        phases = ", ".join("%s %.2f" % (phase, summary["phasesMs"][phase])
+                           for phase in PHASES)
+        hitRate = summary["cacheHitRate"]
+        QgsMessageLog.logMessage(
+            "%s: %d renders, mean %.2f ms, p95 %.2f ms (%s), "
+            "%.0f overlays, %.0f vertices, cache hit rate %s" % (
+                self.name() if callable(self.name) else self.name,
+                summary["renders"], summary["meanMs"],
+                summary["p95Ms"], phases, summary["overlays"],
+                summary["vertices"],
+                "-" if hitRate is None else "%.0f%%" % (100. * hitRate)),
+            "Overlay PC7", Qgis.Info)
@@ -8,43 +8,261 @@ from qgis.core import *
 from qgis.gui import *
 from kadas.kadasgui import *
 
+from geographiclib.geodesic import Geodesic
+
 from .overlay_pc7_layer import OverlayPC7Layer
+from .overlay_pc7_import import importOverlays
+from .overlay_pc7_feed import OverlayPC7Feed, DEFAULT_HOST, DEFAULT_PORT, \
+    DEFAULT_FPS
+from .overlay_pc7_transforms import transformPool
+from .overlay_pc7_geometry import overlayGeometry, levelOfDetail, \
+    geodesicDirect, AXIS_LENGTH, FLIGHT_LINE_LENGTH
 
 OverlayPC7WidgetBase = uic.loadUiType(os.path.join(
     os.path.dirname(__file__), 'overlay_pc7_dialog_base.ui'))[0]
 
 
+class OverlayPC7Preview:
+    """ Lightweight canvas preview of a single overlay, drawn with rubber
+        bands so that it can follow edits without re-rendering the layer. """
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.lines = QgsRubberBand(canvas, QgsWkbTypes.LineGeometry)
+        self.flightLines = QgsRubberBand(canvas, QgsWkbTypes.LineGeometry)
+        self.flightLines.setLineStyle(Qt.DashLine)
+
+    def update(self, center, crs, azimut, azimutLeftFL, azimutRightFL, color,
+               lineWidth):
+        wgsCenter = transformPool.toWgs(crs).transform(center)
+        metersPerPixel = self.canvas.mapUnitsPerPixel() * \
+            QgsUnitTypes.fromUnitToUnitFactor(
+                self.canvas.mapSettings().destinationCrs().mapUnits(),
+                QgsUnitTypes.DistanceMeters)
+        geometry = overlayGeometry(
+            wgsCenter.x(), wgsCenter.y(), azimut, azimutLeftFL, azimutRightFL,
+            *levelOfDetail(metersPerPixel, 0.5))
+
+        def toPolylines(parts):
+            return [[QgsPointXY(x, y) for x, y in coords] for coords in parts]
+
+        wgs84 = transformPool.crs()
+        for rubberBand in [self.lines, self.flightLines]:
+            rubberBand.setColor(color)
+            rubberBand.setWidth(lineWidth)
+        self.lines.setToGeometry(QgsGeometry.fromMultiPolylineXY(
+            toPolylines([geometry.ring, geometry.axis])), wgs84)
+        self.flightLines.setToGeometry(QgsGeometry.fromMultiPolylineXY(
+            toPolylines([geometry.leftFlightLine, geometry.rightFlightLine])),
+            wgs84)
+
+    def clear(self):
+        self.lines.reset(QgsWkbTypes.LineGeometry)
+        self.flightLines.reset(QgsWkbTypes.LineGeometry)
+
+
 class OverlayPC7Tool(QgsMapTool):
 
-    def __init__(self, iface):
+    # Drag handles, in the order returned by handlePoints
+    HANDLE_CENTER, HANDLE_AXIS, HANDLE_LEFT_FL, HANDLE_RIGHT_FL = range(4)
+    HANDLE_TOLERANCE = 8  # pixels
+
+    def __init__(self, iface, layerRegistry):
         QgsMapTool.__init__(self, iface.mapCanvas())
 
         self.iface = iface
+        self.layerRegistry = layerRegistry
         self.picking = False
+        self.dragHandle = None
+        self.dragParameters = None
+        # (layer, overlay index) under the mouse
+        self.hovered = None
+
+        self.handles = QgsRubberBand(iface.mapCanvas(),
+                                     QgsWkbTypes.PointGeometry)
+        self.handles.setIcon(QgsRubberBand.ICON_BOX)
+        self.handles.setIconSize(10)
+        self.handles.setColor(QColor(255, 255, 255))
+        self.handles.setStrokeColor(QColor(0, 0, 0))
+        self.highlight = QgsRubberBand(iface.mapCanvas(),
+                                       QgsWkbTypes.LineGeometry)
+        self.highlight.setColor(QColor(255, 255, 0, 160))
+        self.highlight.setWidth(7)
 
         layer = iface.layerTreeView().currentLayer()
-        if not layer or not isinstance(layer, OverlayPC7Layer):
-            for layerId  in QgsProject.instance().mapLayers():
-                projLayer = QgsProject.instance().mapLayer(layerId)
-                if isinstance(projLayer, OverlayPC7Layer):
-                    layer = projLayer
-                    break
-
-        self.widget = OverlayPC7Widget(self.iface, layer)
+        if not layerRegistry.contains(layer):
+            layer = layerRegistry.firstLayer()
+
+        self.widget = OverlayPC7Widget(self.iface, layer, layerRegistry)
         self.widget.adjustSize()
 
         self.setCursor(Qt.ArrowCursor)
         self.widget.requestPickCenter.connect(self.setPicking)
         self.widget.close.connect(self.close)
+        self.widget.overlayChanged.connect(self.updateHandles)
 
     def activate(self):
         self.widget.setVisible(True)
+        self.updateHandles()
         QgsMapTool.activate(self)
 
     def deactivate(self):
+        self.cancelDrag()
+        self.widget.stopFeed()
+        self.widget.commitPending()
         self.widget.setVisible(False)
+        self.handles.reset(QgsWkbTypes.PointGeometry)
+        self.setHovered(None)
         QgsMapTool.deactivate(self)
 
+    def handlePoints(self, parameters):
+        """ Returns the center and the ends of the axis and of the flight
+            lines of the overlay defined by parameters in canvas CRS. """
+        center, crs, azimut, azimutLeftFL, azimutRightFL = parameters
+        toWgs = transformPool.toWgs(crs)
+        fromWgs = transformPool.fromWgs(
+            self.canvas().mapSettings().destinationCrs())
+        wgsCenter = toWgs.transform(center)
+        lons, lats = geodesicDirect(
+            wgsCenter.x(), wgsCenter.y(),
+            [azimut, azimut + azimutLeftFL, azimut + azimutRightFL],
+            [AXIS_LENGTH, FLIGHT_LINE_LENGTH, FLIGHT_LINE_LENGTH])
+        return [fromWgs.transform(wgsCenter)] + [
+            fromWgs.transform(QgsPointXY(lon, lat))
+            for lon, lat in zip(lons, lats)]
+
+    def updateHandles(self, parameters=None):
+        self.handles.reset(QgsWkbTypes.PointGeometry)
+        if parameters is None and self.dragHandle is not None:
+            parameters = self.currentDragParameters()
+        if parameters is None:
+            parameters = self.widget.overlayParameters()
+        if parameters is None:
+            return
+        points = self.handlePoints(parameters)
+        for point in points:
+            self.handles.addPoint(point, False)
+        self.handles.updatePosition()
+        self.handles.update()
+
+    def handleAt(self, pos):
+        parameters = self.widget.overlayParameters()
+        if parameters is None:
+            return None
+        for handle, point in enumerate(self.handlePoints(parameters)):
+            pixel = self.toCanvasCoordinates(point)
+            if abs(pixel.x() - pos.x()) <= self.HANDLE_TOLERANCE and \
+                    abs(pixel.y() - pos.y()) <= self.HANDLE_TOLERANCE:
+                return handle
+        return None
+
+    def overlayAt(self, pos):
+        """ Returns (layer, overlay index) of the topmost overlay at the
+            canvas position pos, or None. The current layer is searched
+            first. """
+        mapSettings = self.canvas().mapSettings()
+        canvasCrs = mapSettings.destinationCrs()
+        point = self.toMapCoordinates(pos)
+        tolerance = self.HANDLE_TOLERANCE * self.canvas().mapUnitsPerPixel()
+        searchRect = QgsRectangle(
+            point.x() - tolerance, point.y() - tolerance,
+            point.x() + tolerance, point.y() + tolerance)
+        metersPerPixel = self.canvas().mapUnitsPerPixel() * \
+            QgsUnitTypes.fromUnitToUnitFactor(canvasCrs.mapUnits(),
+                                              QgsUnitTypes.DistanceMeters)
+        lod = levelOfDetail(metersPerPixel, 0.5)
+
+        canvasLayers = set(layer.id() for layer in self.canvas().layers())
+        layers = self.layerRegistry.layers()
+        currentLayer = self.widget.currentLayer
+        if currentLayer in layers:
+            layers.remove(currentLayer)
+            layers.insert(0, currentLayer)
+        for layer in layers:
+            if layer.id() not in canvasLayers:
+                continue
+            try:
+                ct = transformPool.transform(canvasCrs, layer.crs())
+                layerPoint = ct.transform(point)
+                layerRect = ct.transformBoundingBox(searchRect)
+            except QgsCsException:
+                continue
+            index = layer.overlayAt(
+                layerPoint, 0.5 * max(layerRect.width(), layerRect.height()),
+                lod)
+            if index >= 0:
+                return layer, index
+        return None
+
+    def setHovered(self, hovered):
+        if hovered == self.hovered:
+            return
+        self.hovered = hovered
+        self.highlight.reset(QgsWkbTypes.LineGeometry)
+        if hovered is None:
+            return
+        layer, index = hovered
+        geometry = layer.getGeometry(layer.getOverlay(index))
+        self.highlight.setToGeometry(QgsGeometry.fromMultiPolylineXY([
+            [QgsPointXY(point) for point in poly] for poly in geometry]),
+            layer.crs())
+
+    def cancelDrag(self):
+        if self.dragHandle is not None:
+            self.dragHandle = None
+            self.dragParameters = None
+            self.widget.preview.clear()
+            self.updateHandles()
+
+    def canvasPressEvent(self, event):
+        if self.picking or event.button() != Qt.LeftButton:
+            return
+        self.widget.commitPending()
+        self.dragHandle = self.handleAt(event.pos())
+        self.dragParameters = self.widget.overlayParameters()
+        if self.dragHandle is not None:
+            self.setHovered(None)
+
+    def canvasMoveEvent(self, event):
+        if self.dragHandle is None:
+            if not self.picking:
+                self.setHovered(self.overlayAt(event.pos()))
+            return
+        # Only the preview and the handles follow the mouse, the layer is
+        # updated on release
+        center, crs, azimut, azimutLeftFL, azimutRightFL = \
+            self.currentDragParameters()
+        pos = self.toMapCoordinates(event.pos())
+        canvasCrs = self.canvas().mapSettings().destinationCrs()
+        if self.dragHandle == self.HANDLE_CENTER:
+            center, crs = pos, canvasCrs
+        else:
+            wgsCenter = transformPool.toWgs(crs).transform(center)
+            wgsPos = transformPool.toWgs(canvasCrs).transform(pos)
+            bearing = Geodesic.WGS84.Inverse(
+                wgsCenter.y(), wgsCenter.x(), wgsPos.y(), wgsPos.x())["azi1"]
+            if self.dragHandle == self.HANDLE_AXIS:
+                azimut = bearing % 360
+            elif self.dragHandle == self.HANDLE_LEFT_FL:
+                azimutLeftFL = (bearing - azimut) % 360
+            else:
+                azimutRightFL = (bearing - azimut) % 360
+        self.dragParameters = (center, crs, azimut, azimutLeftFL,
+                               azimutRightFL)
+        layer = self.widget.currentLayer
+        self.widget.preview.update(*self.dragParameters, layer.getColor(),
+                                   layer.getLineWidth())
+        self.updateHandles(self.dragParameters)
+
+    def currentDragParameters(self):
+        """ Returns the parameters of the drag, with the center following
+            the live feed unless the center handle is dragged. """
+        parameters = self.dragParameters
+        current = self.widget.overlayParameters()
+        if self.dragHandle != self.HANDLE_CENTER and current is not None:
+            parameters = current[:2] + parameters[2:]
+        return parameters
+
     def setPicking(self, picking=True):
         self.picking = picking
         self.setCursor(Qt.CrossCursor if picking else Qt.ArrowCursor)
@@ -53,15 +271,27 @@ class OverlayPC7Tool(QgsMapTool):
         self.iface.mapCanvas().unsetMapTool(self)
 
     def canvasReleaseEvent(self, event):
-        if self.picking:
+        if self.dragHandle is not None:
+            parameters = self.currentDragParameters()
+            self.dragHandle = None
+            self.dragParameters = None
+            self.widget.setOverlayParameters(*parameters)
+        elif self.picking:
             self.widget.centerPicked(self.toMapCoordinates(event.pos()))
             self.setPicking(False)
+        elif event.button() == Qt.LeftButton:
+            hit = self.overlayAt(event.pos())
+            if hit is not None:
+                self.setHovered(None)
+                self.widget.selectOverlay(*hit)
         elif event.button() == Qt.RightButton:
             self.iface.mapCanvas().unsetMapTool(self)
 
     def keyReleaseEvent(self, event):
         if event.key() == Qt.Key_Escape:
-            if self.picking:
+            if self.dragHandle is not None:
+                self.cancelDrag()
+            elif self.picking:
                 self.setPicking(False)
             else:
                 self.iface.mapCanvas().unsetMapTool(self)
@@ -71,13 +301,34 @@ class OverlayPC7Widget(KadasBottomBar, OverlayPC7WidgetBase):
 
     requestPickCenter = pyqtSignal()
     close = pyqtSignal()
+    overlayChanged = pyqtSignal()
+
+    # Edits are previewed at most once per frame interval and committed to
+    # the layer once no further edit arrived for the commit delay (ms)
+    PREVIEW_INTERVAL = 40
+    COMMIT_DELAY = 400
 
-    def __init__(self, iface, layer):
+    def __init__(self, iface, layer, layerRegistry):
         KadasBottomBar.__init__(self, iface.mapCanvas())
 
         self.iface = iface
         self.layerTreeView = iface.layerTreeView()
         self.currentLayer = None
+        self.feed = None
+
+        self.preview = OverlayPC7Preview(iface.mapCanvas())
+        self.previewTimer = QTimer(self)
+        self.previewTimer.setSingleShot(True)
+        self.previewTimer.setInterval(self.PREVIEW_INTERVAL)
+        self.previewTimer.timeout.connect(self.updatePreview)
+        self.commitTimer = QTimer(self)
+        self.commitTimer.setSingleShot(True)
+        self.commitTimer.setInterval(self.COMMIT_DELAY)
+        self.commitTimer.timeout.connect(self.updateLayer)
+        self.repaintTimer = QTimer(self)
+        self.repaintTimer.setSingleShot(True)
+        self.repaintTimer.setInterval(self.PREVIEW_INTERVAL)
+        self.repaintTimer.timeout.connect(self.repaintLayer)
 
         self.setLayout(QHBoxLayout())
         self.layout().setSpacing(10)
@@ -86,11 +337,32 @@ class OverlayPC7Widget(KadasBottomBar, OverlayPC7WidgetBase):
         self.setupUi(base)
         self.layout().addWidget(base)
 
-        layerFilter = lambda layer: isinstance(layer, OverlayPC7Layer)
+        layerFilter = lambda layer: layerRegistry.contains(layer)
         layerCreator = lambda name: self.createLayer(name)
         self.layerSelectionWidget = KadasLayerSelectionWidget(iface.mapCanvas(), iface.layerTreeView(), layerFilter, layerCreator)
         self.layerSelectionWidgetHolder.addWidget(self.layerSelectionWidget)
 
+        self.comboBoxOverlay = QComboBox()
+        self.comboBoxOverlay.setToolTip(self.tr("Overlay"))
+        self.layerSelectionWidgetHolder.addWidget(self.comboBoxOverlay)
+        self.toolButtonAddOverlay = QToolButton()
+        self.toolButtonAddOverlay.setIcon(QIcon(":/images/themes/default/symbologyAdd.svg"))
+        self.toolButtonAddOverlay.setToolTip(self.tr("Add overlay"))
+        self.layerSelectionWidgetHolder.addWidget(self.toolButtonAddOverlay)
+        self.toolButtonRemoveOverlay = QToolButton()
+        self.toolButtonRemoveOverlay.setIcon(QIcon(":/images/themes/default/symbologyRemove.svg"))
+        self.toolButtonRemoveOverlay.setToolTip(self.tr("Remove overlay"))
+        self.layerSelectionWidgetHolder.addWidget(self.toolButtonRemoveOverlay)
+        self.toolButtonImport = QToolButton()
+        self.toolButtonImport.setIcon(QIcon(":/images/themes/default/mActionFileOpen.svg"))
+        self.toolButtonImport.setToolTip(self.tr("Import overlays"))
+        self.layerSelectionWidgetHolder.addWidget(self.toolButtonImport)
+        self.toolButtonFeed = QToolButton()
+        self.toolButtonFeed.setIcon(QIcon(":/images/themes/default/mIconGps.svg"))
+        self.toolButtonFeed.setToolTip(self.tr("Follow live feed"))
+        self.toolButtonFeed.setCheckable(True)
+        self.layerSelectionWidgetHolder.addWidget(self.toolButtonFeed)
+
         closeButton = QPushButton()
         closeButton.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Preferred)
         closeButton.setIcon(QIcon(":/kadas/icons/close"))
@@ -99,14 +371,19 @@ class OverlayPC7Widget(KadasBottomBar, OverlayPC7WidgetBase):
         self.layout().addWidget(closeButton)
         self.layout().setAlignment(closeButton, Qt.AlignTop)
 
-        self.inputCenter.coordinateChanged.connect(self.updateLayer)
+        self.inputCenter.coordinateChanged.connect(self.scheduleUpdate)
         self.toolButtonPickCenter.clicked.connect(self.requestPickCenter)
-        self.spinBoxAzimut.valueChanged.connect(self.updateLayer)
-        self.spinBoxLeftFL.valueChanged.connect(self.updateLayer)
-        self.spinBoxRightFL.valueChanged.connect(self.updateLayer)
+        self.spinBoxAzimut.valueChanged.connect(self.scheduleUpdate)
+        self.spinBoxLeftFL.valueChanged.connect(self.scheduleUpdate)
+        self.spinBoxRightFL.valueChanged.connect(self.scheduleUpdate)
         self.spinBoxLineWidth.valueChanged.connect(self.updateLineWidth)
         self.toolButtonColor.colorChanged.connect(self.updateColor)
         self.layerSelectionWidget.selectedLayerChanged.connect(self.setCurrentLayer)
+        self.comboBoxOverlay.currentIndexChanged.connect(self.setCurrentOverlay)
+        self.toolButtonAddOverlay.clicked.connect(self.addOverlay)
+        self.toolButtonRemoveOverlay.clicked.connect(self.removeOverlay)
+        self.toolButtonImport.clicked.connect(self.importOverlays)
+        self.toolButtonFeed.toggled.connect(self.toggleFeed)
 
         self.layerSelectionWidget.setSelectedLayer(layer)
         self.layerSelectionWidget.createLayerIfEmpty(self.tr("Overlay PC7"))
@@ -122,11 +399,140 @@ class OverlayPC7Widget(KadasBottomBar, OverlayPC7WidgetBase):
     def setCurrentLayer(self, layer):
         if layer == self.currentLayer:
             return
+        self.commitPending()
 
         self.currentLayer = layer if isinstance(layer, OverlayPC7Layer) else False
+        self.updateOverlayList()
+
+    def updateOverlayList(self):
+        self.comboBoxOverlay.blockSignals(True)
+        self.comboBoxOverlay.clear()
+        if self.currentLayer:
+            for i in range(self.currentLayer.overlayCount()):
+                name = self.currentLayer.getOverlay(i).name
+                self.comboBoxOverlay.addItem(
+                    name or self.tr("Overlay {0}").format(i + 1))
+            self.comboBoxOverlay.setCurrentIndex(self.currentLayer.getCurrentIndex())
+        self.comboBoxOverlay.blockSignals(False)
+        self.comboBoxOverlay.setEnabled(bool(self.currentLayer))
+        self.toolButtonAddOverlay.setEnabled(bool(self.currentLayer))
+        self.toolButtonFeed.setEnabled(
+            bool(self.currentLayer) or self.toolButtonFeed.isChecked())
+        self.toolButtonRemoveOverlay.setEnabled(
+            bool(self.currentLayer) and self.currentLayer.overlayCount() > 0)
+        self.loadCurrentOverlay()
+
+    def setCurrentOverlay(self, index):
+        self.commitPending()
+        if self.currentLayer:
+            self.currentLayer.setCurrentOverlay(index)
+            self.loadCurrentOverlay()
+
+    def selectOverlay(self, layer, index):
+        """ Selects the overlay at index of layer for editing. """
+        self.commitPending()
+        if layer != self.currentLayer:
+            self.layerSelectionWidget.setSelectedLayer(layer)
+        if layer != self.currentLayer:
+            return
+        self.comboBoxOverlay.setCurrentIndex(index)
 
+    def addOverlay(self):
+        self.commitPending()
         if not self.currentLayer:
+            return
+        crs = self.iface.mapCanvas().mapSettings().destinationCrs()
+        ct = transformPool.transform(crs, self.currentLayer.crs())
+        index = self.currentLayer.addOverlay(
+            ct.transform(self.iface.mapCanvas().extent().center()),
+            22.5, 45, 135)
+        self.currentLayer.setCurrentOverlay(index)
+        self.updateOverlayList()
+        self.currentLayer.triggerRepaint()
+
+    def removeOverlay(self):
+        self.commitPending()
+        if not self.currentLayer or not self.currentLayer.getCurrentOverlay():
+            return
+        self.currentLayer.removeOverlay(self.currentLayer.getCurrentIndex())
+        self.updateOverlayList()
+        self.currentLayer.triggerRepaint()
+
+    def importOverlays(self):
+        self.commitPending()
+        path = QFileDialog.getOpenFileName(
+            self, self.tr("Import overlays"), "",
+            self.tr("CSV or GeoJSON (*.csv *.geojson *.json *.geojsonl *.geojsons *.ndjson)"))[0]
+        if not path:
+            return
+        try:
+            layer, count, errors = importOverlays(
+                path, self.currentLayer or None)
+        except (OSError, ValueError) as e:
+            self.iface.messageBar().pushMessage(
+                self.tr("Import overlays"),
+                self.tr("Failed to read {0}: {1}").format(path, e),
+                Qgis.Critical, 5)
+            return
+        for number, message in errors[:100]:
+            QgsMessageLog.logMessage(
+                self.tr("{0}, row {1}: {2}").format(path, number, message),
+                "Overlay PC7", Qgis.Warning)
+        if layer == self.currentLayer:
+            self.updateOverlayList()
+        else:
+            self.layerSelectionWidget.setSelectedLayer(layer)
+        self.iface.messageBar().pushMessage(
+            self.tr("Import overlays"),
+            self.tr("{0} overlays imported, {1} invalid rows skipped").format(
+                count, len(errors)),
+            Qgis.Warning if errors else Qgis.Info, 5)
+
+    def toggleFeed(self, active):
+        """ Starts or stops moving the overlays of the current layer with the
+            live feed configured in the overlaypc7/feed settings. """
+        if self.feed:
+            self.feed.stop()
+            self.feed = None
+        if not active:
+            return
+        if not self.currentLayer:
+            self.toolButtonFeed.setChecked(False)
+            return
+        self.commitPending()
+        settings = QSettings()
+        self.feed = OverlayPC7Feed(
+            self.currentLayer,
+            settings.value("overlaypc7/feed/protocol", "udp"),
+            settings.value("overlaypc7/feed/host", DEFAULT_HOST),
+            settings.value("overlaypc7/feed/port", DEFAULT_PORT, type=int),
+            settings.value("overlaypc7/feed/fps", DEFAULT_FPS, type=float))
+        self.feed.error.connect(self.feedError)
+        self.feed.updated.connect(self.feedUpdated)
+        self.feed.start()
+
+    def stopFeed(self):
+        """ Stops the live feed, it must not outlive the tool. """
+        self.toolButtonFeed.setChecked(False)
+        if self.feed:
+            self.feed.stop()
+            self.feed = None
+
+    def feedUpdated(self):
+        """ Shows the position and heading from the feed in the inputs and
+            handles, unless an edit is pending, which takes precedence. """
+        if not self.commitTimer.isActive():
+            self.loadCurrentOverlay()
+
+    def feedError(self, message):
+        self.iface.messageBar().pushMessage(
+            self.tr("Live feed"), message, Qgis.Critical, 5)
+        self.toolButtonFeed.setChecked(False)
+
+    def loadCurrentOverlay(self):
+        if not self.currentLayer or not self.currentLayer.getCurrentOverlay():
             self.widgetLayerSetup.setEnabled(False)
+            self.overlayChanged.emit()
             return
 
         self.inputCenter.blockSignals(True)
@@ -149,28 +555,85 @@ class OverlayPC7Widget(KadasBottomBar, OverlayPC7WidgetBase):
         self.toolButtonColor.setColor(self.currentLayer.getColor())
         self.toolButtonColor.blockSignals(False)
         self.widgetLayerSetup.setEnabled(True)
+        self.overlayChanged.emit()
+
+    def overlayParameters(self):
+        """ Returns (center, crs, azimut, azimutLeftFL, azimutRightFL) of the
+            overlay being edited, or None. """
+        if not self.currentLayer or not self.currentLayer.getCurrentOverlay() \
+                or self.inputCenter.isEmpty():
+            return None
+        return (self.inputCenter.getCoordinate(), self.inputCenter.getCrs(),
+                self.spinBoxAzimut.value(), self.spinBoxLeftFL.value(),
+                self.spinBoxRightFL.value())
+
+    def setOverlayParameters(self, center, crs, azimut, azimutLeftFL,
+                             azimutRightFL):
+        """ Sets the inputs and updates the layer at once. """
+        self.inputCenter.blockSignals(True)
+        self.inputCenter.setCoordinate(center, crs)
+        self.inputCenter.blockSignals(False)
+        self.spinBoxAzimut.blockSignals(True)
+        self.spinBoxAzimut.setValue(azimut)
+        self.spinBoxAzimut.blockSignals(False)
+        self.spinBoxLeftFL.blockSignals(True)
+        self.spinBoxLeftFL.setValue(azimutLeftFL)
+        self.spinBoxLeftFL.blockSignals(False)
+        self.spinBoxRightFL.blockSignals(True)
+        self.spinBoxRightFL.setValue(azimutRightFL)
+        self.spinBoxRightFL.blockSignals(False)
+        self.updateLayer()
 
     def centerPicked(self, pos):
         self.inputCenter.setCoordinate(
             pos, self.iface.mapCanvas().mapSettings().destinationCrs())
 
+    def scheduleUpdate(self):
+        """ Coalesces bursts of edits: the preview follows at most once per
+            frame interval, the layer is only updated once input settles. """
+        if not self.previewTimer.isActive():
+            self.previewTimer.start()
+        self.commitTimer.start()
+
+    def commitPending(self):
+        if self.commitTimer.isActive():
+            self.updateLayer()
+        if self.repaintTimer.isActive():
+            self.repaintLayer()
+
+    def scheduleRepaint(self):
+        if not self.repaintTimer.isActive():
+            self.repaintTimer.start()
+
+    def repaintLayer(self):
+        self.repaintTimer.stop()
+        if self.currentLayer:
+            self.currentLayer.triggerRepaint()
+
+    def updatePreview(self):
+        parameters = self.overlayParameters()
+        if parameters is None or not self.commitTimer.isActive():
+            return
+        self.preview.update(*parameters, self.currentLayer.getColor(),
+                            self.currentLayer.getLineWidth())
+
     def updateLayer(self):
-        if not self.currentLayer or self.inputCenter.isEmpty():
-            return
-        center = self.inputCenter.getCoordinate()
-        crs = self.inputCenter.getCrs()
-        azimut = self.spinBoxAzimut.value()
-        azimutLeftFL = self.spinBoxLeftFL.value()
-        azimutRightFL = self.spinBoxRightFL.value()
-        self.currentLayer.setup(center, crs, azimut, azimutLeftFL, azimutRightFL)
+        self.previewTimer.stop()
+        self.commitTimer.stop()
+        self.preview.clear()
+        parameters = self.overlayParameters()
+        if parameters is None:
+            return
+        self.currentLayer.setup(*parameters)
         self.currentLayer.triggerRepaint()
+        self.overlayChanged.emit()
 
     def updateColor(self, color):
-        if self.currentLayer:
+        if self.currentLayer and self.currentLayer.getCurrentOverlay():
             self.currentLayer.setColor(color)
-            self.currentLayer.triggerRepaint()
+            self.scheduleRepaint()
 
     def updateLineWidth(self, width):
-        if self.currentLayer:
+        if self.currentLayer and self.currentLayer.getCurrentOverlay():
             self.currentLayer.setLineWidth(width)
-            self.currentLayer.triggerRepaint()
+            self.scheduleRepaint()
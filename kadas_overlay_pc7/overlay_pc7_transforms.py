@@ -0,0 +1,73 @@
+"""
+Pool of coordinate reference systems and coordinate transforms shared by the
+PC7 layers, their renderers and tools.
+
+Creating a QgsCoordinateTransform looks up the coordinate operation between
+the two CRSs, which is much more expensive than copying an existing one. The
+pool is invalidated when the project's transform context changes.
+"""
+import threading
+
+from qgis.core import *
+
+
+WGS84 = "EPSG:4326"
+
+
+class TransformPool:
+    """ Thread-safe cache of CRSs keyed by definition and of transforms
+        keyed by CRS pair and transform context. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.crsByDefinition = {}
+        self.transforms = {}
+
+    def crs(self, definition=WGS84):
+        """ Returns a copy of the CRS for definition (authid, WKT or proj
+            string). """
+        with self.lock:
+            crs = self.crsByDefinition.get(definition)
+        if crs is None:
+            crs = QgsCoordinateReferenceSystem(definition)
+            with self.lock:
+                self.crsByDefinition[definition] = crs
+        return QgsCoordinateReferenceSystem(crs)
+
+    @staticmethod
+    def crsKey(crs):
+        return crs.authid() or crs.toWkt()
+
+    @staticmethod
+    def contextKey(transformContext):
+        return frozenset(transformContext.coordinateOperations().items())
+
+    def transform(self, source, destination, transformContext=None):
+        """ Returns a copy of the transform from source to destination CRS
+            in transformContext (default: the project's). """
+        if transformContext is None:
+            transformContext = QgsProject.instance().transformContext()
+        key = (self.crsKey(source), self.crsKey(destination),
+               self.contextKey(transformContext))
+        with self.lock:
+            ct = self.transforms.get(key)
+        if ct is None:
+            ct = QgsCoordinateTransform(source, destination, transformContext)
+            with self.lock:
+                self.transforms[key] = ct
+        return QgsCoordinateTransform(ct)
+
+    def toWgs(self, crs, transformContext=None):
+        return self.transform(crs, self.crs(), transformContext)
+
+    def fromWgs(self, crs, transformContext=None):
+        return self.transform(self.crs(), crs, transformContext)
+
+    def invalidate(self):
+        """ Drops all cached transforms, connected to the project's
+            transformContextChanged signal. """
+        with self.lock:
+            self.transforms.clear()
+
+
+transformPool = TransformPool()
@@ -1,6 +1,7 @@
 SOURCES += overlay_pc7_layer.py \
            overlay_pc7.py \
-           overlay_pc7_tool.py
+           overlay_pc7_tool.py \
+           overlay_pc7_layer_type.py
 
 FORMS += overlay_pc7_dialog_base.ui
 
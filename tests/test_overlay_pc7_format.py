@@ -0,0 +1,42 @@
+"""
+Tests of the packed overlay format, run with pytest:
+
+    python3 -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from kadas_overlay_pc7.overlay_pc7_format import packOverlays, \
+    unpackOverlays
+
+
+OVERLAYS = [
+    (2600000.5, 1200000.25, 270.5, 45., 135., 0xff0000ff, 3, "PC7-1"),
+    (7.44, 46.95, 0., 30., 150., 0x80ff8000, 1, ""),
+    (-1e7, 1e-9, 359.999, 0., 360., 0, 65535, "Überflug ✈"),
+]
+
+
+def test_round_trip():
+    assert unpackOverlays(packOverlays(OVERLAYS)) == OVERLAYS
+
+
+def test_empty():
+    assert unpackOverlays(packOverlays([])) == []
+
+
+def test_invalid():
+    text = packOverlays(OVERLAYS)
+    with pytest.raises(ValueError):
+        unpackOverlays(text[:len(text) // 2])
+    with pytest.raises(ValueError):
+        unpackOverlays(packOverlays([])[:4])
+
+
+def test_clamped_line_width():
+    overlay = OVERLAYS[0][:6] + (70000, "wide")
+    assert unpackOverlays(packOverlays([overlay]))[0][6] == 0xffff
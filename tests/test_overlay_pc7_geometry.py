@@ -0,0 +1,67 @@
+"""
+Tests of the Qt-free overlay geometry, run with pytest:
+
+    python3 -m pytest tests
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from kadas_overlay_pc7.overlay_pc7_geometry import geodesicDirect, \
+    maxTangentPlaneError, tangentPlaneBound, AXIS_LENGTH, \
+    FLIGHT_LINE_LENGTH, RING_RADIUS
+
+
+# Equator, mid latitudes, near the poles and across the antimeridian
+CENTERS = [(0., 0.), (7.44, 46.95), (-122.4, 37.8), (151.2, -33.9),
+           (25., 89.5), (-60., -89.5), (179.99, 10.), (-179.99, -10.)]
+AZIMUTHS = np.arange(0., 360., 15.)
+
+
+def maxDeviation(lon, lat, azimuths, distances):
+    """ Returns the largest distance in meters between geodesicDirect and
+        geographiclib's reference solution for the given problems. """
+    from geographiclib.geodesic import Geodesic
+
+    geod = Geodesic.WGS84
+    azimuths, distances = np.broadcast_arrays(
+        np.asarray(azimuths, dtype=float), np.asarray(distances, dtype=float))
+    lon2, lat2 = geodesicDirect(lon, lat, azimuths, distances)
+    deviation = 0.
+    for i in range(azimuths.size):
+        ref = geod.Direct(lat, lon, azimuths.flat[i], distances.flat[i])
+        inv = geod.Inverse(ref["lat2"], ref["lon2"], lat2.flat[i],
+                           lon2.flat[i])
+        deviation = max(deviation, inv["s12"])
+    return deviation
+
+
+@pytest.mark.parametrize("lon, lat", CENTERS)
+def test_geodesic_overlay_distances(lon, lat):
+    pytest.importorskip("geographiclib")
+    for distance in (RING_RADIUS, AXIS_LENGTH, FLIGHT_LINE_LENGTH):
+        assert maxDeviation(lon, lat, AZIMUTHS, distance) < 1e-7
+
+
+@pytest.mark.parametrize("lon, lat", CENTERS)
+def test_geodesic_long_distances(lon, lat):
+    pytest.importorskip("geographiclib")
+    assert maxDeviation(lon, lat, AZIMUTHS, 1e6) < 1e-5
+
+
+@pytest.mark.parametrize("lat", [-90., -89.999, -89.954, -89.5, -60.3, -0.5,
+                                 0., 12.25, 46.95, 89.5, 89.954, 89.999])
+def test_tangent_plane_bound(lat):
+    deviation = maxTangentPlaneError(0., lat, np.arange(0., 360., 1.),
+                                     FLIGHT_LINE_LENGTH)
+    assert tangentPlaneBound(lat) >= deviation
+
+
+def test_tangent_plane_bound_mid_latitudes():
+    # Well within the default tolerance of 5 cm
+    for lat in range(-60, 61):
+        assert tangentPlaneBound(lat) < 0.05